@@ -0,0 +1,511 @@
+"""
+Benchmark de carga offline da API.
+
+Sobe a API com o uvicorn neste processo, trocando o Gemini por um modelo falso
+determinístico (latência e taxa de falhas configuráveis, incluindo 503) e o
+servidor SMTP por um sink local. Só o modelo é falso: os agentes, o Team, as
+ferramentas, o storage das sessões e o continue_run do agno rodam de verdade, e o
+modelo falso passa pelo limitador de chamadas da API. Cada usuário virtual repete o ciclo:
+POST /generate_post -> GET /get_post -> GET /approve_post ou /reject_post
+(alternados), com um GET /metrics a cada --metrics-every ciclos.
+
+Reporta p50/p95/p99 por endpoint, requisições por segundo e a contenção de
+lock do SQLite (tempo de espera do BEGIN IMMEDIATE por banco). No modo team o
+e-mail é enfileirado pela ferramenta do ApprovalAgent, depois da confirmação.
+
+Com --pool-size, a API mantém rascunhos pré-gerados (DRAFT_POOL_SIZE) e a carga só
+começa depois que o pool enche; o pool só atende pedidos sem bypass_cache.
+
+Uso (na raiz do repositório):
+    python benchmarks/load.py --requests 200 --concurrency 8 --latency-ms 300 --failure-rate 0.05 --output bench_load.json
+    python benchmarks/load.py --requests 200 --concurrency 2 --pool-size 20 --output bench_pool.json
+"""
+import argparse
+import asyncio
+import contextlib
+import http.client
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from agno.exceptions import ModelProviderError
+from agno.models.base import Model
+from agno.models.response import ModelResponse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from src.ratelimit import RateLimitedModel  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(samples: list[float], duration: float) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "rps": round(len(ordered) / duration, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Modelo falso no lugar do Gemini ---
+class FakeGemini:
+    """
+    Backend determinístico compartilhado pelos modelos falsos: cada chamada espera `latency`
+    (+ jitter sorteado com a semente) e falha com 503 com probabilidade `failure_rate`.
+    """
+
+    def __init__(self, latency: float, jitter: float, failure_rate: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self.posts = itertools.count(1)  # Numeração dos posts e ideias falsos
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, model_name: str, model_id: str):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.failure_rate
+            self.calls += 1
+            self.failures += int(fail)
+        time.sleep(delay)
+        if fail:
+            raise ModelProviderError("503 UNAVAILABLE: The model is overloaded. Please try again later. (simulado)",
+                                     status_code=503, model_name=model_name, model_id=model_id)
+
+    def __deepcopy__(self, memo):
+        # Cópias de agentes e modelos feitas pelo agno continuam contando no mesmo backend
+        return self
+
+
+@dataclass
+class ScriptedModel(Model):
+    """
+    Modelo do agno com respostas roteirizadas a partir das mensagens e das ferramentas
+    oferecidas, para que agentes, Team, ferramentas, storage e continue_run rodem de verdade:
+
+    - Team (transfer_task_to_member): passa o tópico ao TopicAgent, o post ao ApprovalAgent
+      e devolve o JSON que o ApprovalAgent produziu;
+    - TopicAgent (get_trending_topics): chama a ferramenta e escolhe a primeira ideia; o
+      run aninhado da ferramenta recebe 5 ideias numeradas;
+    - ApprovalAgent (send_post_for_approval): chama a ferramenta (que pede confirmação) e,
+      depois dela, devolve o post em JSON;
+    - PostWriter (sem ferramentas, saída estruturada): devolve o rascunho em JSON.
+    """
+
+    id: str = "fake-gemini"
+    name: str = "FakeGemini"
+    provider: str = "Benchmark"
+    backend: FakeGemini | None = None
+
+    def invoke(self, messages, response_format=None, tools=None, tool_choice=None) -> ModelResponse:
+        return self._respond(messages, tools)
+
+    def invoke_stream(self, messages, response_format=None, tools=None, tool_choice=None):
+        yield self._respond(messages, tools)
+
+    async def ainvoke(self, messages, response_format=None, tools=None, tool_choice=None) -> ModelResponse:
+        return await asyncio.to_thread(self._respond, messages, tools)
+
+    async def ainvoke_stream(self, messages, response_format=None, tools=None, tool_choice=None):
+        yield await asyncio.to_thread(self._respond, messages, tools)
+
+    def parse_provider_response(self, response: ModelResponse, **kwargs) -> ModelResponse:
+        return response
+
+    def parse_provider_response_delta(self, response: ModelResponse) -> ModelResponse:
+        return response
+
+    # --- Roteiro ---
+    def _respond(self, messages, tools) -> ModelResponse:
+        self.backend.call(self.name, self.id)
+        names = {tool.get("function", {}).get("name") for tool in tools or []}
+        # Resultados de ferramentas do run atual (depois da última mensagem do usuário)
+        last_user = max((index for index, message in enumerate(messages) if message.role == "user"), default=-1)
+        results = [message.get_content_string() for message in messages[last_user + 1:] if message.role == "tool"]
+        prompt = messages[last_user].get_content_string() if last_user >= 0 else ""
+
+        # Run aninhado do TopicAgent dentro de get_trending_topics (que também oferece a ferramenta)
+        if prompt.startswith("Você é um gerador de ideias"):
+            number = next(self.backend.posts)
+            return self._content("\n".join(f"Ideia de benchmark {number}.{index} sobre automação de CRM" for index in range(1, 6)))
+        if "transfer_task_to_member" in names:
+            if not results:
+                return self._tool_call("transfer_task_to_member", member_id="topic-agent",
+                                       task_description=f"Escolha um tópico. Pedido: {prompt.strip()}", expected_output="Um tópico")
+            if len(results) == 1:
+                topic = results[0].strip().splitlines()[0] if results[0].strip() else "CRM com IA"
+                return self._tool_call("transfer_task_to_member", member_id="approval-agent",
+                                       task_description=f"Gere o post sobre o tópico: {topic}", expected_output="O post em JSON")
+            return self._content(self._post_json(results[-1]))
+        if "get_trending_topics" in names:
+            if not results:
+                return self._tool_call("get_trending_topics", area_of_interest="CRM e IA")
+            return self._content(results[-1].strip().splitlines()[0])
+        if "send_post_for_approval" in names:
+            if not results:
+                return self._tool_call("send_post_for_approval", post=self._new_post(prompt), session_id="benchmark")
+            # Depois do envio (no continue_run), devolve o mesmo post que foi para aprovação
+            sent = [json.loads(call["function"]["arguments"])["post"]
+                    for message in messages[last_user + 1:] if message.role == "assistant"
+                    for call in message.tool_calls or [] if call["function"]["name"] == "send_post_for_approval"]
+            return self._content(json.dumps(sent[-1] if sent else self._new_post(prompt), ensure_ascii=False))
+        post = self._new_post(prompt)
+        return self._content(json.dumps({key: post[key] for key in ("title", "content", "hashtags")}, ensure_ascii=False))
+
+    def _new_post(self, prompt: str) -> dict:
+        number = next(self.backend.posts)
+        return {
+            "id": 0,
+            "title": f"Post de benchmark {number}",
+            "content": f"## Conteúdo gerado\n{prompt.strip()[:200]}",
+            "hashtags": ["#IA", "#CRM", "#Benchmark"],
+            "status": "pending",
+            "created_at": "",
+        }
+
+    def _post_json(self, member_output: str) -> str:
+        # O coordenador repete o JSON do ApprovalAgent; se o membro não devolveu um, gera o post aqui
+        start, end = member_output.find("{"), member_output.rfind("}")
+        if start >= 0 and end > start:
+            try:
+                return json.dumps(json.loads(member_output[start:end + 1]), ensure_ascii=False)
+            except json.JSONDecodeError:
+                pass
+        return json.dumps(self._new_post(member_output), ensure_ascii=False)
+
+    @staticmethod
+    def _content(content: str) -> ModelResponse:
+        return ModelResponse(role="assistant", content=content)
+
+    @staticmethod
+    def _tool_call(name: str, **arguments) -> ModelResponse:
+        call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+        return ModelResponse(role="assistant", tool_calls=[call])
+
+
+@dataclass
+class FakeModel(RateLimitedModel, ScriptedModel):
+    """
+    ScriptedModel sob o limitador de chamadas da API, como o LimitedGemini.
+    """
+
+
+# --- Sink SMTP local ---
+class SMTPSink:
+    """
+    Servidor SMTP mínimo (asyncio) que aceita e descarta as mensagens, contando sessões e e-mails.
+    Não anuncia STARTTLS nem AUTH.
+    """
+
+    def __init__(self):
+        self.port = free_port()
+        self.sessions = 0
+        self.messages = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._serve, name="smtp-sink", daemon=True).start()
+        self._started.wait(5)
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.sessions += 1
+        writer.write(b"220 localhost SMTP sink\r\n")
+        await writer.drain()
+        while line := await reader.readline():
+            command = line[:4].upper()
+            if command == b"EHLO":
+                writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif command == b"DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while await reader.readline() not in (b".\r\n", b""):
+                    pass
+                self.messages += 1
+                writer.write(b"250 OK\r\n")
+            elif command == b"QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+
+# --- Medição da contenção de lock do SQLite ---
+class LockMonitor:
+    """
+    Envolve ConnectionPool.transaction para medir quanto cada BEGIN IMMEDIATE espera
+    pelo lock de escrita e quantas transações falham com "database is locked". A transação
+    original continua sendo usada, com os spans db_lock_wait e db_write.
+    """
+
+    def __init__(self):
+        self._waits: dict[str, list[float]] = {}
+        self._locked: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def install(self, pool_class):
+        monitor = self
+        original = pool_class.transaction
+
+        @contextlib.contextmanager
+        def transaction(pool):
+            start = time.perf_counter()
+            began = False
+            try:
+                with original(pool) as cursor:
+                    # A transação original só devolve o cursor depois do BEGIN IMMEDIATE
+                    monitor._record(pool.db_file, time.perf_counter() - start)
+                    began = True
+                    yield cursor
+            except sqlite3.OperationalError as e:
+                if not began:
+                    monitor._record(pool.db_file, time.perf_counter() - start, locked="locked" in str(e))
+                raise
+
+        pool_class.transaction = transaction
+
+    def _record(self, db_file: str, wait: float, locked: bool = False):
+        name = os.path.basename(db_file)
+        with self._lock:
+            self._waits.setdefault(name, []).append(wait)
+            self._locked[name] = self._locked.get(name, 0) + int(locked)
+
+    def report(self) -> dict:
+        with self._lock:
+            waits = {name: sorted(values) for name, values in self._waits.items()}
+            locked = dict(self._locked)
+        return {
+            name: {
+                "transactions": len(values),
+                "waits_over_1ms": sum(1 for value in values if value > 0.001),
+                "wait_total_ms": round(sum(values) * 1000, 1),
+                "wait_p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "wait_max_ms": round(values[-1] * 1000, 2),
+                "locked_errors": locked.get(name, 0),
+            }
+            for name, values in waits.items()
+        }
+
+
+# --- Cliente de carga ---
+class LoadDriver:
+    def __init__(self, port: int, args):
+        self.port = port
+        self.args = args
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def request(self, name: str, method: str, path: str, body: dict | None = None) -> dict | None:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            self._local.conn = None
+            data, status = b"", type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if status != 200:
+                errors = self.errors.setdefault(name, {})
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        return json.loads(data) if status == 200 else None
+
+    def cycle(self, index: int):
+        post = self.request("generate_post", "POST", "/generate_post", {
+            "session_id": f"bench_{index % self.args.concurrency}",
+            "bypass_cache": not (self.args.use_cache or self.args.pool_size),
+            "on_duplicate": "allow",
+        })
+        if not post:
+            return
+        self.request("get_post", "GET", f"/get_post/{post['id']}")
+        if index % 2 == 0:
+            self.request("approve_post", "GET", f"/approve_post/{post['id']}")
+        else:
+            self.request("reject_post", "GET", f"/reject_post/{post['id']}?reason=benchmark")
+        if index % self.args.metrics_every == 0:
+            self.request("metrics", "GET", "/metrics")
+
+    def run(self) -> float:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix="load") as executor:
+            list(executor.map(self.cycle, range(self.args.requests)))
+        return time.perf_counter() - start
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("O uvicorn não iniciou.")
+        time.sleep(0.01)
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga offline com Gemini e SMTP falsos.")
+    parser.add_argument("--requests", type=int, default=100, help="Quantidade de ciclos gerar/consultar/aprovar.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Usuários virtuais simultâneos.")
+    parser.add_argument("--mode", choices=["team", "pipeline"], default="team", help="Valor de GENERATION_MODE.")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Latência base de cada chamada ao modelo falso.")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Latência extra sorteada (uniforme) por chamada.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fração das chamadas que falham com 503.")
+    parser.add_argument("--metrics-every", type=int, default=5, help="Chama /metrics a cada N ciclos.")
+    parser.add_argument("--gemini-rpm", type=int, default=6000, help="Valor de GEMINI_RPM durante o benchmark.")
+    parser.add_argument("--use-cache", action="store_true", help="Não envia bypass_cache (permite acertos no cache do LLM).")
+    parser.add_argument("--pool-size", type=int, default=0, help="Valor de DRAFT_POOL_SIZE (rascunhos pré-gerados do perfil padrão).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="Mostra os prints da API.")
+    parser.add_argument("--output", help="Arquivo JSON para gravar o resultado.")
+    args = parser.parse_args()
+
+    smtp = SMTPSink()
+    smtp.start()
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_USER": "benchmark@localhost",
+        "SMTP_PASSWORD": "benchmark",
+        "SMTP_STARTTLS": "false",
+        "SMTP_POLL_INTERVAL": "0.2",
+        "GENERATION_MODE": args.mode,
+        "GEMINI_RPM": str(args.gemini_rpm),
+        "DRAFT_POOL_SIZE": str(args.pool_size),
+        "DRAFT_POOL_RETRY_DELAY": "0.2",
+    })
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Bancos em tmp/ relativos ao diretório de trabalho: cada execução começa do zero
+        os.chdir(workdir)
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            import src.main as api
+            from src.database import ConnectionPool
+
+            monitor = LockMonitor()
+            monitor.install(ConnectionPool)
+            model = FakeGemini(args.latency_ms / 1000, args.jitter_ms / 1000, args.failure_rate, args.seed)
+            # Só o modelo é trocado: agentes, Team, ferramentas e storage são os reais
+            def new_model():
+                fake = FakeModel(backend=model)
+                fake.limiter = api.gemini_limiter
+                return fake
+
+            api.new_model = new_model
+
+            port = free_port()
+            server, thread = start_server(api.app, port)
+            try:
+                driver = LoadDriver(port, args)
+                deadline = time.monotonic() + 120
+                while api.draft_pool and min(api.database.count_pooled_drafts().values(), default=0) < args.pool_size and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                duration = driver.run()
+                final_metrics = driver.request("final_metrics", "GET", "/metrics") or {}
+                pool_stats = driver.request("final_metrics", "GET", "/pool/stats") or {}
+                # Dá tempo para o OutboxSender drenar os e-mails enfileirados
+                conn = api.database.pool.connection()
+                deadline = time.monotonic() + 10
+                while (emails_pending := conn.execute("SELECT COUNT(*) FROM email_outbox WHERE status = 'pending'").fetchone()[0]) and time.monotonic() < deadline:
+                    time.sleep(0.1)
+            finally:
+                server.should_exit = True
+                thread.join(10)
+                smtp.stop()
+            os.chdir(REPO_ROOT)
+
+    latencies = {name: values for name, values in driver.latencies.items() if name != "final_metrics"}
+    total_requests = sum(len(values) for values in latencies.values())
+    result = {
+        "benchmark": "load",
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "duration_s": round(duration, 2),
+        "total_requests": total_requests,
+        "rps": round(total_requests / duration, 2),
+        "cycles_per_second": round(args.requests / duration, 2),
+        "endpoints": {name: summarize(values, duration) for name, values in sorted(latencies.items())},
+        "errors": driver.errors,
+        "model": {"calls": model.calls, "failures": model.failures},
+        "smtp": {"sessions": smtp.sessions, "messages": smtp.messages, "outbox_pending": emails_pending},
+        "db_lock": monitor.report(),
+        "generation_modes": final_metrics.get("generation_modes", {}),
+        "draft_pool": pool_stats,
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
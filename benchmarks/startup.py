@@ -0,0 +1,116 @@
+"""
+Benchmark de inicialização da API.
+
+Mede, em processos novos:
+- o tempo de `import src.main`;
+- o tempo até a primeira resposta 200 de GET /health com o uvicorn.
+
+Uso (na raiz do repositório):
+    python benchmarks/startup.py --runs 5 --mode lazy --output bench_startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Valores fictícios: no modo lazy nenhuma chamada ao Gemini ou ao SMTP acontece no startup
+DEFAULT_ENV = {
+    "GOOGLE_API_KEY": "benchmark",
+    "SMTP_SERVER": "localhost",
+    "SMTP_PORT": "1025",
+    "SMTP_USER": "benchmark@localhost",
+    "SMTP_PASSWORD": "benchmark",
+}
+
+
+def build_env(mode: str) -> dict:
+    env = dict(os.environ)
+    for key, value in DEFAULT_ENV.items():
+        env.setdefault(key, value)
+    env["AGENT_INIT_MODE"] = mode
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: dict, workdir: str) -> float:
+    code = "import time; t = time.perf_counter(); import src.main; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=workdir, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_first_healthy(env: dict, workdir: str, timeout: float = 60.0) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/health não respondeu em {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+        "samples_ms": [round(sample * 1000, 1) for sample in samples],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de import e o tempo até o primeiro /health saudável.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=["lazy", "eager"], default="lazy", help="Valor de AGENT_INIT_MODE.")
+    parser.add_argument("--output", help="Arquivo JSON para gravar o resultado.")
+    args = parser.parse_args()
+
+    env = build_env(args.mode)
+    import_samples, healthy_samples = [], []
+    for _ in range(args.runs):
+        # Diretório novo a cada execução: o banco em tmp/ é criado do zero (cold start)
+        with tempfile.TemporaryDirectory() as workdir:
+            import_samples.append(measure_import(env, workdir))
+        with tempfile.TemporaryDirectory() as workdir:
+            healthy_samples.append(measure_first_healthy(env, workdir))
+
+    result = {
+        "benchmark": "startup",
+        "mode": args.mode,
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "import": summarize(import_samples),
+        "first_healthy_response": summarize(healthy_samples),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Comandos administrativos executados fora da API.
+
+Uso:
+    python -m src.admin rebuild-metrics
+    python -m src.admin seed-topics [--file caminho/para/topicos.txt]
+"""
+import argparse
+
+from src import database
+
+
+def rebuild_metrics(args: argparse.Namespace):
+    database.init_schema()
+    database.rebuild_metrics()
+    print("Contadores de métricas recalculados.")
+
+
+def seed_topics(args: argparse.Namespace):
+    database.init_schema()
+    inserted = database.insert_topics(database.load_seed_topics(args.file))
+    print(f"{inserted} tópicos inseridos ({database.count_topics()} no total).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos administrativos do Agente de Conteúdo para LinkedIn.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    subparsers.add_parser("rebuild-metrics", help="Recalcula os contadores de /metrics a partir das tabelas de posts.").set_defaults(func=rebuild_metrics)
+    
+    seed_parser = subparsers.add_parser("seed-topics", help="Insere no banco os tópicos de um arquivo (um por linha) que ainda não existem.")
+    seed_parser.add_argument("--file", default=database.SEED_TOPICS_FILE, help="Arquivo de tópicos (padrão: src/seed_topics.txt).")
+    seed_parser.set_defaults(func=seed_topics)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
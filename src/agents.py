@@ -0,0 +1,314 @@
+"""
+Ferramentas, agentes e Team do gerador de posts.
+
+Este módulo importa o agno (e o SDK do Gemini), que é caro de carregar; por isso
+o main.py só o importa na primeira geração (ou no startup com AGENT_INIT_MODE=eager).
+
+Cada pedido roda em agentes e Team próprios da sua sessão (ver build_content_agents e
+SessionCache), para que os pedidos gerem em paralelo sem disputar o estado dos runs.
+Os SqliteStorage são compartilhados entre as sessões.
+"""
+from dataclasses import dataclass, field
+from typing import Callable
+from textwrap import dedent
+
+import orjson
+
+from agno.agent import Agent
+from agno.models.base import Model
+from agno.models.google import Gemini
+from agno.storage.sqlite import SqliteStorage
+from agno.team.team import Team
+from agno.tools import tool
+
+from src import tracing
+from src.llm_cache import LLMCache
+from src.models import PostDraft, PostResponse
+from src.ratelimit import GeminiRateLimiter, RateLimitedModel
+from src.similarity import SimilarityIndex
+
+MODEL_ID = "gemini-1.5-flash"
+DB_FILE = "tmp/linkedin.db"
+
+# Memória aproximada dos agentes, do Team e das ferramentas de uma sessão, sem o histórico (medida com tracemalloc)
+SESSION_BASE_BYTES = 32 * 1024
+
+# Tópicos usados quando o Gemini não responde na geração de ideias
+FALLBACK_TOPICS = [
+    "Como a IA generativa aumenta a receita no CRM em 2025",
+    "Automação de SDRs com IA para maior conversão",
+    "KPIs de CRM para gestão estratégica",
+    "Modelos preditivos para fidelização de clientes",
+    "Engajamento de clientes com personalização via IA",
+]
+
+# Formato do post, compartilhado pelo ApprovalAgent (preenchido pelo session_state) e pelo PostWriter (via str.format)
+POST_FORMAT_GUIDE = dedent("""\
+    Sua tarefa é gerar um post para LinkedIn com base no tópico fornecido: '{topic}'.
+    Siga este formato para criar um post profissional e estratégico, com tom {tone} e aproximadamente {length} caracteres:
+    
+    1. **Introdução com gancho**: Comece com uma pergunta ou cenário envolvente que conecte com as dores ou interesses de gestores de negócios.
+    2. **Contexto estratégico**: Explique por que o tópico é relevante, destacando benefícios como aumento de receita, redução de custos ou melhoria na tomada de decisão.
+    3. **Explicação prática**: Forneça um guia claro (ex.: passos, fórmula, checklist) para aplicar o conceito, com exemplos concretos (ex.: "Redução de 30% no tempo de análise").
+    4. **Exemplos de impacto**: Inclua 2-3 exemplos de resultados mensuráveis (ex.: percentuais de melhoria, economia financeira).
+    5. **Chamada à ação (CTA)**: Finalize com a CTA fornecida ('{call_to_action}') e um tom de continuidade (ex.: "Nos vemos na próxima semana!").
+    
+    Use parágrafos curtos, subtítulos em markdown (##) e linguagem clara. Inclua 3-5 hashtags relevantes baseadas no tópico (ex.: #IA, #ROI, #Automação).
+""")
+
+
+class SessionStorage:
+    """
+    Storage de uma única sessão sobre um SqliteStorage compartilhado. As gravações vão
+    direto para o SQLite, mas a leitura que o agno faz no início de cada run devolve a
+    última versão gravada por este contexto, guardada em memória. Contextos simultâneos
+    da mesma sessão não veem o histórico de runs um do outro; os tópicos usados, que
+    precisam estar completos, são sincronizados pelo main.py (ver remember_used_topic).
+    """
+
+    def __init__(self, storage: SqliteStorage, session_id: str):
+        self._storage = storage
+        self.session_id = session_id
+        self._session = storage.read(session_id=session_id)
+        self.size = _session_size(self._session)
+
+    @property
+    def mode(self):
+        return self._storage.mode
+
+    @mode.setter
+    def mode(self, value):
+        self._storage.mode = value
+
+    def read(self, session_id: str, user_id: str | None = None):
+        if session_id != self.session_id:
+            return self._storage.read(session_id=session_id, user_id=user_id)
+        return self._session
+
+    def upsert(self, session, create_and_retry: bool = True):
+        saved = self._storage.upsert(session, create_and_retry)
+        if saved is not None and session.session_id == self.session_id:
+            self._session = saved
+            self.size = _session_size(saved)
+        return saved
+
+    def stored_state(self) -> dict:
+        """
+        session_state gravado da sessão ({} se a sessão ainda não existir).
+        """
+        session_data = getattr(self._session, "session_data", None) or {}
+        return dict(session_data.get("session_state") or {})
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+def _session_size(session) -> int:
+    if session is None:
+        return 0
+    return len(orjson.dumps(session.to_dict(), default=str))
+
+
+def build_storages() -> dict[str, SqliteStorage]:
+    """
+    SqliteStorage de cada tabela de sessões, compartilhados pelos agentes de todas as sessões.
+    As tabelas são criadas aqui: o agno as cria na primeira leitura, e sessões construídas ao
+    mesmo tempo disputariam a criação.
+    """
+    storages = {
+        "topic_agent": SqliteStorage(table_name="topic_agent_sessions", db_file=DB_FILE),
+        "approval_agent": SqliteStorage(table_name="approval_agent_sessions", db_file=DB_FILE),
+        "team": SqliteStorage(table_name="team_sessions", db_file=DB_FILE, mode="team"),
+    }
+    for storage in storages.values():
+        storage.create()
+    return storages
+
+
+@dataclass
+class ContentAgents:
+    topic_agent: Agent
+    approval_agent: Agent
+    content_team: Team
+    storages: list[SessionStorage] = field(default_factory=list)
+
+    def estimated_bytes(self) -> int:
+        # Base fixa mais o tamanho serializado das sessões em memória (estado e histórico dos runs)
+        return SESSION_BASE_BYTES + sum(storage.size for storage in self.storages)
+
+    def reset_streaming(self):
+        # O agno guarda stream=True no Team e nos membros após um run com streaming
+        # (self.stream = self.stream or stream): sem isso, o próximo run devolveria um gerador
+        for runner in (self.content_team, self.topic_agent, self.approval_agent):
+            runner.stream = None
+            runner.stream_intermediate_steps = False
+
+
+# --- Modelo ---
+class LimitedGemini(RateLimitedModel, Gemini):
+    """
+    Gemini cujas requisições passam pelo limitador de chamadas (se houver um).
+    """
+
+
+def build_gemini(limiter: GeminiRateLimiter | None = None) -> Gemini:
+    model = LimitedGemini(id=MODEL_ID)
+    model.limiter = limiter
+    return model
+
+
+# --- Função de Contexto para Tendências ---
+def get_external_trends() -> str:
+    return "Tendências de 2025: IA preditiva domina CRM, automação de vendas cresce 20%, foco em KPIs de receita."
+
+
+def build_content_agents(
+    llm_cache: LLMCache,
+    topic_index: SimilarityIndex,
+    prior_topics_k: int = 10,
+    session_id: str = "default_session",
+    storages: dict[str, SqliteStorage] | None = None,
+    model_factory: Callable[[], Model] = build_gemini,
+) -> ContentAgents:
+    """
+    Constrói as ferramentas, os agentes e o Team de uma sessão com suas dependências.
+    O session_state começa do que está gravado para a sessão nos `storages`; cada agente
+    e o Team recebem um modelo novo de `model_factory`.
+    """
+    storages = storages or build_storages()
+    topic_storage = SessionStorage(storages["topic_agent"], session_id)
+    approval_storage = SessionStorage(storages["approval_agent"], session_id)
+    team_storage = SessionStorage(storages["team"], session_id)
+
+    def remove_duplicate_topics(content: str | None) -> str | None:
+        # Descarta ideias quase-duplicadas de posts anteriores antes de o ApprovalAgent gerar o post
+        if not content:
+            return content
+        lines = [line for line in content.splitlines() if line.strip()]
+        fresh = [line for line in lines if not topic_index.find_duplicate(line)]
+        return "\n".join(fresh or lines)
+
+    # --- Ferramentas para os Agentes ---
+    @tool
+    def get_trending_topics(agent: Agent, area_of_interest: str = "Ciência de Dados, CRM ou IA") -> str:
+        """
+        Gera uma lista de 5 tópicos relevantes e em alta para posts de LinkedIn, evitando repetições com base no session_state.
+        """
+        with tracing.span("tool_call", tool="get_trending_topics"):
+            # Só os k tópicos anteriores mais parecidos (e os mais recentes) vão para o prompt
+            used_topics = agent.session_state.get("used_topics", []) if agent else []
+            similar_topics = [topic for topic, _ in topic_index.most_similar(area_of_interest, prior_topics_k)]
+            used_topics = list(dict.fromkeys(similar_topics + used_topics[::-1]))[:prior_topics_k]
+            
+            prompt = dedent(f"""\
+                Você é um gerador de ideias de conteúdo para LinkedIn, focado em {area_of_interest}.
+                Gere 5 ideias de tópicos inovadores e práticos para gestores de negócios, evitando os seguintes tópicos já usados: {', '.join(used_topics) if used_topics else 'Nenhum'}.
+                Considere tendências de 2025 e temas como: KPIs de CRM, aplicações de IA, automação (ex.: SDR/BDR), personalização, previsão/preditivo, receita, faturamento, engajamento, fidelização, gestão estratégica.
+                Priorize palavras-chave: conversão, fidelização, receita, faturamento, engajamento, automação, KPIs, estratégico, gestão, previsão, preditivo.
+                Retorne apenas os títulos, uma por linha.
+            """)
+            
+            model_id = agent.model.id if agent and agent.model else ""
+            cache_key = llm_cache.make_key(model_id, prompt)
+            cached = llm_cache.get("topics", cache_key)
+            if cached:
+                return remove_duplicate_topics(cached)
+            
+            try:
+                with tracing.span("model_call", agent="TopicAgent") as span:
+                    response = agent.run(prompt, stream=False)
+                    tracing.record_run_metrics(response, span)
+                if response.content:
+                    llm_cache.set("topics", cache_key, model_id, response.content)
+                return remove_duplicate_topics(response.content)
+            except Exception as e:
+                print(f"Erro ao gerar tópicos: {e}")
+                return "\n".join(FALLBACK_TOPICS)
+
+    @tool(requires_confirmation=True)
+    def send_post_for_approval(agent: Agent, post: PostResponse, session_id: str) -> str:
+        """
+        Envia o post gerado por e-mail para aprovação.
+        """
+        # Só marca o ponto de confirmação: o post ainda não tem id aqui, e o run do Team pode ser
+        # repetido. O e-mail é enfileirado pelo finalize_post, depois que o post é salvo.
+        return "Post confirmado; o e-mail de aprovação será enfileirado quando o post for salvo."
+
+    # --- Inicializa os Agentes ---
+    topic_agent = Agent(
+        name="TopicAgent",
+        model=model_factory(),
+        description="Você é um assistente especializado em gerar tópicos relevantes para posts no LinkedIn sobre Ciência de Dados, CRM e IA.",
+        instructions=dedent("""\
+            Sua tarefa é gerar tópicos relevantes para posts no LinkedIn, com base em tendências externas e histórico de sessões.
+            Use a ferramenta `get_trending_topics` para obter tópicos novos, evitando repetições com base nos tópicos usados: {used_topics}.
+            Tendências externas: {external_trends}
+            Retorne apenas o tópico selecionado.
+        """),
+        tools=[get_trending_topics],
+        storage=topic_storage,
+        session_state={"used_topics": [], **topic_storage.stored_state(), "external_trends": get_external_trends()},
+        add_state_in_messages=True,
+        add_history_to_messages=True,
+        num_history_runs=3,
+        markdown=True,
+        show_tool_calls=True,
+    )
+
+    approval_agent = Agent(
+        name="ApprovalAgent",
+        model=model_factory(),
+        description="Você é um assistente especializado em gerar posts para LinkedIn e gerenciar aprovação.",
+        instructions=POST_FORMAT_GUIDE + "Retorne o post no formato JSON com os campos: id, title, content, hashtags, status.\n",
+        tools=[send_post_for_approval],
+        storage=approval_storage,
+        session_state={**approval_storage.stored_state(), "external_trends": get_external_trends()},
+        add_state_in_messages=True,
+        add_history_to_messages=True,
+        num_history_runs=3,
+        markdown=True,
+        show_tool_calls=True,
+        response_model=PostResponse,
+    )
+
+    # --- Inicializa o Team ---
+    content_team = Team(
+        name="LinkedInContentTeam",
+        mode="coordinate",
+        model=model_factory(),
+        members=[topic_agent, approval_agent],
+        instructions=[
+            "Collaborar para gerar um post no LinkedIn com base em um tópico relevante.",
+            "O TopicAgent deve selecionar um tópico usando `get_trending_topics`.",
+            "O ApprovalAgent deve gerar o post com base no tópico e enviá-lo para aprovação.",
+            "Retornar apenas a resposta final do ApprovalAgent no formato JSON.",
+        ],
+        storage=team_storage,
+        session_state={"used_topics": [], **team_storage.stored_state(), "external_trends": get_external_trends()},
+        markdown=True,
+        show_members_responses=True,
+        enable_agentic_context=True,
+        add_datetime_to_instructions=True,
+    )
+
+    return ContentAgents(
+        topic_agent=topic_agent,
+        approval_agent=approval_agent,
+        content_team=content_team,
+        storages=[topic_storage, approval_storage, team_storage],
+    )
+
+
+def build_post_writer(model: Model | None = None) -> Agent:
+    """
+    Agente do modo pipeline: uma única chamada com saída estruturada, sem ferramentas nem histórico.
+    Sem efeitos colaterais nem storage, então pode ser duplicado com segurança pelo hedging.
+    Cada instância atende um run por vez (o agno guarda o estado do run no agente).
+    """
+    return Agent(
+        name="PostWriter",
+        model=model or build_gemini(),
+        description="Você é um assistente especializado em escrever posts para LinkedIn sobre Ciência de Dados, CRM e IA.",
+        instructions="Escreva o post pedido seguindo exatamente o formato descrito e preencha os campos title, content e hashtags.",
+        response_model=PostDraft,
+    )
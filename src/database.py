@@ -0,0 +1,715 @@
+import ast
+import base64
+import contextlib
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+import orjson
+
+from src import tracing
+
+DB_FILE = "tmp/linkedin.db"
+SEED_TOPICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_topics.txt")
+
+# Versão do schema gravada em PRAGMA user_version (ver MIGRATIONS)
+SCHEMA_VERSION = 8
+
+
+class ConnectionPool:
+    """
+    Pool com uma conexão SQLite por thread, configurada em modo WAL para que
+    leitores não sejam bloqueados pelo escritor. As conexões ficam em modo
+    autocommit; escritas devem usar `transaction()`.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # Seguro com WAL: perde no máximo o último commit em queda de energia
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            conn.execute("PRAGMA cache_size = -16000")  # ~16 MB por conexão
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Abre uma transação de escrita (BEGIN IMMEDIATE) e faz commit ou rollback ao final.
+        """
+        conn = self.connection()
+        db = os.path.basename(self.db_file)
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        # Espera pelo lock de escrita, separada do tempo da transação em si
+        tracing.record("db_lock_wait", time.perf_counter() - started, db=db)
+        with tracing.span("db_write", db=db):
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def dedicated_connection(self):
+        """
+        Conexão somente leitura fora do pool, para leituras longas (exportação). Pode ser usada
+        de várias threads, como as do threadpool que retomam o iterador de um StreamingResponse.
+        """
+        conn = sqlite3.connect(self.db_file, isolation_level=None, timeout=5.0, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("PRAGMA query_only = ON")
+            yield conn
+        finally:
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass  # Conexão criada em outra thread já encerrada
+            self._connections.clear()
+        self._local = threading.local()
+
+
+pool = ConnectionPool(DB_FILE)
+
+
+# --- Serialização das hashtags ---
+def encode_hashtags(hashtags: list[str]) -> str:
+    return orjson.dumps(list(hashtags)).decode("utf-8")
+
+def decode_hashtags(value: str | None) -> list[str]:
+    if not value:
+        return []
+    return orjson.loads(value)
+
+
+# --- Schema e migrações ---
+def _migrate_hashtags_to_json(cursor: sqlite3.Cursor):
+    # Linhas antigas foram gravadas com str(list) e lidas com eval()
+    rows = cursor.execute("SELECT id, hashtags FROM posts WHERE hashtags IS NOT NULL").fetchall()
+    for post_id, hashtags in rows:
+        try:
+            orjson.loads(hashtags)
+        except orjson.JSONDecodeError:
+            cursor.execute("UPDATE posts SET hashtags = ? WHERE id = ?", (encode_hashtags(ast.literal_eval(hashtags)), post_id))
+
+def _migration_1(cursor: sqlite3.Cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topics_topic ON topics(topic)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topics_usage ON topics(usage_count, last_used)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at)")
+    _migrate_hashtags_to_json(cursor)
+
+def _migration_2(cursor: sqlite3.Cursor):
+    # Fila persistente de e-mails de aprovação (drenada pelo OutboxSender)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER,
+            session_id TEXT,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)")
+
+def _migration_3(cursor: sqlite3.Cursor):
+    # Contadores de métricas mantidos na mesma transação das escritas em posts
+    cursor.execute("ALTER TABLE posts ADD COLUMN topic TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS post_counters (
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key, status)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rejection_reason_counters (
+            reason TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    # Os contadores são preenchidos pela migração 6, que muda o formato deles
+
+def _migration_4(cursor: sqlite3.Cursor):
+    # Rascunhos pré-gerados (status 'pooled') ficam em posts, marcados com o perfil que os gerou
+    cursor.execute("ALTER TABLE posts ADD COLUMN pool_profile TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_pool ON posts(pool_profile, id) WHERE status = 'pooled'")
+
+def _migration_5(cursor: sqlite3.Cursor):
+    # Paginação por cursor (keyset) em (created_at, id), com ou sem filtro de status ou sessão
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_id ON posts(created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_status_created_id ON posts(status, created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_session_created_id ON posts(session_id, created_at, id)")
+    # Prefixos dos novos índices
+    cursor.execute("DROP INDEX IF EXISTS idx_posts_created_at")
+    cursor.execute("DROP INDEX IF EXISTS idx_posts_status")
+
+def _migration_6(cursor: sqlite3.Cursor):
+    # Contadores por dia das quebras por sessão, tópico e motivo de rejeição, para filtrar as métricas por data
+    cursor.execute("DROP TABLE IF EXISTS rejection_reason_counters")
+    cursor.execute("""
+        CREATE TABLE rejection_reason_counters (
+            reason TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (reason, day)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS breakdown_day_counters (
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, day, key, status)
+        ) WITHOUT ROWID
+    """)
+    _rebuild_metrics(cursor)
+
+def _migration_7(cursor: sqlite3.Cursor):
+    # Reserva temporária do tópico escolhido para uma geração (ver reserve_topic)
+    cursor.execute("ALTER TABLE topics ADD COLUMN reserved_until REAL")
+
+def _migration_8(cursor: sqlite3.Cursor):
+    # Um e-mail de aprovação por post: mantém o primeiro dos repetidos (runs do Team repetidos)
+    # e descarta os pendentes gravados pela ferramenta do ApprovalAgent antes de o post existir (id 0)
+    cursor.execute("DELETE FROM email_outbox WHERE status = 'pending' AND post_id NOT IN (SELECT id FROM posts)")
+    cursor.execute("DELETE FROM email_outbox WHERE id NOT IN (SELECT MIN(id) FROM email_outbox GROUP BY post_id) AND post_id IS NOT NULL")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_email_outbox_post ON email_outbox(post_id)")
+
+MIGRATIONS = {
+    1: _migration_1,
+    2: _migration_2,
+    3: _migration_3,
+    4: _migration_4,
+    5: _migration_5,
+    6: _migration_6,
+    7: _migration_7,
+    8: _migration_8,
+}
+
+def init_schema():
+    """
+    Cria as tabelas de tópicos e posts e aplica as migrações pendentes.
+    """
+    with pool.transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                usage_count INTEGER DEFAULT 0,
+                last_used TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                title TEXT,
+                content TEXT,
+                hashtags TEXT,
+                status TEXT DEFAULT 'pending',
+                rejection_reason TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            print(f"Aplicando migração {target} do banco de dados...")
+            MIGRATIONS[target](cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+
+
+# --- Tópicos ---
+def load_seed_topics(path: str = SEED_TOPICS_FILE) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def count_topics() -> int:
+    return pool.connection().execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+
+def insert_topics(topics: list[str]) -> int:
+    """
+    Insere os tópicos que ainda não existem no banco. Retorna quantos foram inseridos.
+    """
+    with pool.transaction() as cursor:
+        existing = {row[0] for row in cursor.execute("SELECT topic FROM topics").fetchall()}
+        new_topics = list(dict.fromkeys(topic for topic in topics if topic not in existing))
+        cursor.executemany("INSERT INTO topics (topic, usage_count) VALUES (?, 0)", [(topic,) for topic in new_topics])
+        return len(new_topics)
+
+def least_used_topic() -> str | None:
+    row = pool.connection().execute("SELECT topic FROM topics ORDER BY usage_count ASC, last_used ASC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+def reserve_topic(accept: Callable[[str], bool], ttl: float = 600.0, limit: int = 20) -> str | None:
+    """
+    Reserva por `ttl` segundos o tópico menos usado que `accept` aprovar, ignorando os já
+    reservados e os que têm um rascunho no pool. Se nenhum candidato passar (todo tópico já usado
+    está no índice de quase-duplicatas), reutiliza o menos usado e há mais tempo sem uso.
+    A escolha e a reserva acontecem no mesmo BEGIN IMMEDIATE, então pedidos simultâneos (e o pool)
+    recebem tópicos diferentes. A reserva é liberada quando um post com o tópico é salvo, ou
+    expira se a geração falhar. Retorna None só quando todos os tópicos estão reservados.
+    """
+    now = time.time()
+    with pool.transaction() as cursor:
+        rows = cursor.execute(
+            """
+            SELECT topic FROM topics
+            WHERE (reserved_until IS NULL OR reserved_until < ?)
+              AND topic NOT IN (SELECT topic FROM posts WHERE status = 'pooled' AND topic IS NOT NULL)
+            ORDER BY usage_count ASC, last_used ASC LIMIT ?
+            """,
+            (now, limit)
+        ).fetchall()
+        if not rows:
+            return None
+        topic = next((topic for (topic,) in rows if accept(topic)), rows[0][0])
+        cursor.execute("UPDATE topics SET reserved_until = ? WHERE topic = ?", (now + ttl, topic))
+        return topic
+
+def fetch_similarity_corpus() -> list[str]:
+    """
+    Textos já usados que alimentam o índice de quase-duplicatas: títulos dos posts e tópicos já utilizados
+    (rascunhos do pool só entram quando são retirados).
+    """
+    conn = pool.connection()
+    titles = [row[0] for row in conn.execute("SELECT title FROM posts WHERE title IS NOT NULL AND status != 'pooled'")]
+    topics = [row[0] for row in conn.execute("SELECT topic FROM topics WHERE usage_count > 0")]
+    return titles + topics
+
+def fetch_popular_topics(limit: int = 5) -> list[str]:
+    rows = pool.connection().execute("SELECT topic FROM topics ORDER BY usage_count DESC LIMIT ?", (limit,)).fetchall()
+    return [row[0] for row in rows]
+
+
+# --- Posts ---
+def insert_post(cursor: sqlite3.Cursor, topic: str, post_data: dict, session_id: str) -> int:
+    # created_at explícito em UTC (mesmo formato do CURRENT_TIMESTAMP) para alimentar os contadores
+    created_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    status = post_data.get("status", "pending")
+    cursor.execute(
+        "INSERT INTO posts (session_id, topic, title, content, hashtags, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (session_id, topic, post_data["title"], post_data["content"], encode_hashtags(post_data["hashtags"]), status, created_at)
+    )
+    post_id = cursor.lastrowid
+    cursor.execute("UPDATE topics SET usage_count = usage_count + 1, last_used = ?, reserved_until = NULL WHERE topic = ?",
+                   (datetime.datetime.now(), topic))
+    _bump_counters(cursor, created_at, session_id, topic, status, 1)
+    return post_id
+
+def save_post_to_db(topic: str, post_data: dict, session_id: str) -> int:
+    with pool.transaction() as cursor:
+        return insert_post(cursor, topic, post_data, session_id)
+
+def fetch_post(post_id: int) -> dict | None:
+    row = pool.connection().execute(
+        "SELECT id, session_id, title, content, hashtags, status, rejection_reason, created_at FROM posts WHERE id = ? AND status != 'pooled'",
+        (post_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "session_id": row[1],
+        "title": row[2],
+        "content": row[3],
+        "hashtags": decode_hashtags(row[4]),
+        "status": row[5],
+        "rejection_reason": row[6],
+        "created_at": row[7],
+    }
+
+def _set_post_status(cursor: sqlite3.Cursor, post_id: int, status: str, rejection_reason: str | None = None) -> bool:
+    """
+    Muda o status de um post na transação do cursor, movendo-o entre os contadores de métricas
+    (geral, dia, semana, sessão e tópico) e os de motivos de rejeição. Retorna False se o post
+    não existir (ou ainda estiver no pool).
+    """
+    row = cursor.execute(
+        "SELECT created_at, session_id, topic, status, rejection_reason FROM posts WHERE id = ? AND status != 'pooled'", (post_id,)
+    ).fetchone()
+    if not row:
+        return False
+    created_at, session_id, topic, old_status, old_reason = row
+    if status == "rejected":
+        cursor.execute("UPDATE posts SET status = ?, rejection_reason = ? WHERE id = ?", (status, rejection_reason, post_id))
+    else:
+        cursor.execute("UPDATE posts SET status = ? WHERE id = ?", (status, post_id))
+    
+    if old_status != status:
+        _bump_counters(cursor, created_at, session_id, topic, old_status, -1)
+        _bump_counters(cursor, created_at, session_id, topic, status, 1)
+    if old_status == "rejected":
+        _bump_reason(cursor, created_at, old_reason, -1)
+    if status == "rejected":
+        _bump_reason(cursor, created_at, rejection_reason, 1)
+    return True
+
+def update_post_status(post_id: int, status: str, rejection_reason: str | None = None) -> bool:
+    """
+    Atualiza o status de um post. Retorna False se o post não existir (ou ainda estiver no pool).
+    """
+    with pool.transaction() as cursor:
+        return _set_post_status(cursor, post_id, status, rejection_reason)
+
+def update_posts_status(changes: list[tuple[int, str, str | None]]) -> list[bool]:
+    """
+    Aplica vários (post_id, status, motivo) em ordem, em uma única transação (um único commit).
+    Retorna, para cada item, se o post existia.
+    """
+    with pool.transaction() as cursor:
+        return [_set_post_status(cursor, post_id, status, reason) for post_id, status, reason in changes]
+
+
+# --- Listagem e exportação de posts ---
+POST_COLUMNS = "id, session_id, topic, title, content, hashtags, status, rejection_reason, created_at"
+
+def _post_row_to_dict(row: tuple) -> dict:
+    return {
+        "id": row[0],
+        "session_id": row[1],
+        "topic": row[2],
+        "title": row[3],
+        "content": row[4],
+        "hashtags": decode_hashtags(row[5]),
+        "status": row[6],
+        "rejection_reason": row[7],
+        "created_at": row[8],
+    }
+
+def encode_cursor(created_at: str, post_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([created_at, post_id])).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """
+    Lê o cursor devolvido por list_posts. Levanta ValueError se ele for inválido.
+    """
+    try:
+        created_at, post_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, UnicodeEncodeError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    if not isinstance(created_at, str) or not isinstance(post_id, int):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return created_at, post_id
+
+def _post_filters(status: str | None, session_id: str | None, start_date: datetime.date | None, end_date: datetime.date | None) -> tuple[list[str], list]:
+    # Rascunhos do pool nunca aparecem; o intervalo de datas (UTC) inclui os dois extremos
+    clauses, params = ["status != 'pooled'"], []
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if session_id:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    if start_date:
+        clauses.append("created_at >= ?")
+        params.append(start_date.isoformat())
+    if end_date:
+        clauses.append("created_at < ?")
+        params.append((end_date + datetime.timedelta(days=1)).isoformat())
+    return clauses, params
+
+def list_posts(
+    limit: int = 50,
+    cursor: str | None = None,
+    status: str | None = None,
+    session_id: str | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    Uma página de posts, dos mais recentes para os mais antigos, e o cursor da próxima página
+    (None na última). A página seguinte começa logo depois do (created_at, id) do cursor, pelo
+    índice, sem OFFSET.
+    """
+    clauses, params = _post_filters(status, session_id, start_date, end_date)
+    if cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    rows = pool.connection().execute(
+        f"SELECT {POST_COLUMNS} FROM posts WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, id DESC LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+    posts = [_post_row_to_dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(posts[-1]["created_at"], posts[-1]["id"]) if len(rows) > limit else None
+    return posts, next_cursor
+
+def iter_posts(
+    status: str | None = None,
+    session_id: str | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+    batch_size: int = 500,
+):
+    """
+    Percorre os posts filtrados (mais recentes primeiro) em lotes de `batch_size`, lidos do
+    cursor do SQLite conforme são consumidos: a memória usada não depende do total de posts.
+    Roda em uma conexão própria e em uma única transação de leitura (um snapshot do WAL).
+    """
+    clauses, params = _post_filters(status, session_id, start_date, end_date)
+    with pool.dedicated_connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(
+                f"SELECT {POST_COLUMNS} FROM posts WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, id DESC", params
+            )
+            while batch := rows.fetchmany(batch_size):
+                yield [_post_row_to_dict(row) for row in batch]
+        finally:
+            conn.execute("ROLLBACK")
+
+
+# --- Pool de rascunhos pré-gerados ---
+def insert_pooled_draft(topic: str, post_data: dict, profile: str) -> int:
+    """
+    Guarda um rascunho pronto no pool. Não conta nos contadores nem no uso do tópico até ser retirado.
+    """
+    with pool.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO posts (topic, title, content, hashtags, status, pool_profile) VALUES (?, ?, ?, ?, 'pooled', ?)",
+            (topic, post_data["title"], post_data["content"], encode_hashtags(post_data["hashtags"]), profile)
+        )
+        return cursor.lastrowid
+
+def count_pooled_drafts() -> dict[str, int]:
+    rows = pool.connection().execute(
+        "SELECT pool_profile, COUNT(*) FROM posts WHERE status = 'pooled' GROUP BY pool_profile"
+    ).fetchall()
+    return dict(rows)
+
+def claim_pooled_draft(profile: str, session_id: str) -> dict | None:
+    """
+    Retira o rascunho mais antigo do perfil, que passa a ser um post 'pending' da sessão criado agora.
+    O BEGIN IMMEDIATE garante que dois pedidos simultâneos não retirem o mesmo rascunho.
+    """
+    created_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    with pool.transaction() as cursor:
+        row = cursor.execute(
+            "SELECT id, topic, title, content, hashtags FROM posts WHERE status = 'pooled' AND pool_profile = ? ORDER BY id LIMIT 1",
+            (profile,)
+        ).fetchone()
+        if not row:
+            return None
+        post_id, topic, title, content, hashtags = row
+        cursor.execute(
+            "UPDATE posts SET status = 'pending', session_id = ?, created_at = ?, pool_profile = NULL WHERE id = ?",
+            (session_id, created_at, post_id)
+        )
+        cursor.execute("UPDATE topics SET usage_count = usage_count + 1, last_used = ? WHERE topic = ?",
+                       (datetime.datetime.now(), topic))
+        _bump_counters(cursor, created_at, session_id, topic, "pending", 1)
+    return {
+        "id": post_id,
+        "topic": topic,
+        "title": title,
+        "content": content,
+        "hashtags": decode_hashtags(hashtags),
+        "status": "pending",
+        "created_at": created_at,
+    }
+
+
+# --- Contadores de métricas ---
+def iso_week(created_at: str) -> str:
+    """
+    Converte um timestamp do SQLite em semana ISO no formato 'AAAA-Wss'.
+    """
+    year, week, _ = datetime.date.fromisoformat(str(created_at)[:10]).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _bump_counters(cursor: sqlite3.Cursor, created_at: str, session_id: str | None, topic: str | None, status: str, delta: int):
+    day = str(created_at)[:10]
+    keys = [
+        ("all", ""),
+        ("day", day),
+        ("week", iso_week(created_at)),
+        ("session", session_id or ""),
+        ("topic", topic or ""),
+    ]
+    cursor.executemany(
+        """
+        INSERT INTO post_counters (dimension, key, status, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT (dimension, key, status) DO UPDATE SET count = count + excluded.count
+        """,
+        [(dimension, key, status, delta) for dimension, key in keys]
+    )
+    # Sessão e tópico também por dia, para as métricas filtradas por data
+    cursor.executemany(
+        """
+        INSERT INTO breakdown_day_counters (dimension, key, day, status, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (dimension, day, key, status) DO UPDATE SET count = count + excluded.count
+        """,
+        [(dimension, key, day, status, delta) for dimension, key in keys[3:]]
+    )
+
+def _bump_reason(cursor: sqlite3.Cursor, created_at: str, reason: str | None, delta: int):
+    cursor.execute(
+        """
+        INSERT INTO rejection_reason_counters (reason, day, count) VALUES (?, ?, ?)
+        ON CONFLICT (reason, day) DO UPDATE SET count = count + excluded.count
+        """,
+        (reason or "", str(created_at)[:10], delta)
+    )
+
+def _rebuild_metrics(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM post_counters")
+    cursor.execute("DELETE FROM breakdown_day_counters")
+    cursor.execute("DELETE FROM rejection_reason_counters")
+    rows = cursor.execute("""
+        SELECT date(created_at), session_id, topic, status, COUNT(*)
+        FROM posts
+        WHERE status != 'pooled'
+        GROUP BY date(created_at), session_id, topic, status
+    """).fetchall()
+    for day, session_id, topic, status, count in rows:
+        _bump_counters(cursor, day, session_id, topic, status, count)
+    rows = cursor.execute(
+        "SELECT date(created_at), rejection_reason, COUNT(*) FROM posts WHERE status = 'rejected' GROUP BY date(created_at), rejection_reason"
+    ).fetchall()
+    for day, reason, count in rows:
+        _bump_reason(cursor, day, reason, count)
+
+def rebuild_metrics():
+    """
+    Recalcula todos os contadores de métricas a partir das tabelas de posts.
+    """
+    with pool.transaction() as cursor:
+        _rebuild_metrics(cursor)
+
+def fetch_metrics(start_date: datetime.date | None = None, end_date: datetime.date | None = None, status: str | None = None) -> dict:
+    """
+    Lê as métricas pré-computadas. O intervalo de datas (UTC, pela data de criação do post) e o
+    status se aplicam a todas as contagens; os motivos de rejeição ficam vazios com outro status.
+    """
+    conn = pool.connection()
+    status_clause, status_params = ("AND status = ?", (status,)) if status else ("", ())
+    ranged = bool(start_date or end_date)
+    start = start_date.isoformat() if start_date else "0000-00-00"
+    end = end_date.isoformat() if end_date else "9999-99-99"
+    
+    if ranged:
+        rows = conn.execute(
+            f"SELECT key, status, count FROM post_counters WHERE dimension = 'day' AND key BETWEEN ? AND ? {status_clause}",
+            (start, end, *status_params)
+        ).fetchall()
+        posts_per_week, posts_per_status = {}, {}
+        for day, row_status, count in rows:
+            week = iso_week(day)
+            posts_per_week[week] = posts_per_week.get(week, 0) + count
+            posts_per_status[row_status] = posts_per_status.get(row_status, 0) + count
+    else:
+        rows = conn.execute(
+            f"SELECT key, SUM(count) FROM post_counters WHERE dimension = 'week' {status_clause} GROUP BY key", status_params
+        ).fetchall()
+        posts_per_week = dict(rows)
+        rows = conn.execute(
+            f"SELECT status, count FROM post_counters WHERE dimension = 'all' {status_clause}", status_params
+        ).fetchall()
+        posts_per_status = dict(rows)
+    
+    def breakdown(dimension: str) -> dict:
+        if ranged:
+            rows = conn.execute(
+                f"SELECT key, SUM(count) FROM breakdown_day_counters WHERE dimension = ? AND day BETWEEN ? AND ? AND key != '' {status_clause} GROUP BY key",
+                (dimension, start, end, *status_params)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT key, SUM(count) FROM post_counters WHERE dimension = ? AND key != '' {status_clause} GROUP BY key",
+                (dimension, *status_params)
+            ).fetchall()
+        return {key: count for key, count in rows if count}
+    
+    reviewed = posts_per_status.get("approved", 0) + posts_per_status.get("rejected", 0)
+    if status and status != "rejected":
+        rejection_reasons = {}
+    else:
+        rows = conn.execute(
+            "SELECT reason, SUM(count) FROM rejection_reason_counters WHERE day BETWEEN ? AND ? GROUP BY reason", (start, end)
+        ).fetchall()
+        rejection_reasons = {reason: count for reason, count in rows if count}
+    return {
+        "posts_per_week": {week: count for week, count in sorted(posts_per_week.items()) if count},
+        "posts_per_status": {key: count for key, count in posts_per_status.items() if count},
+        "posts_per_session": breakdown("session"),
+        "posts_per_topic": breakdown("topic"),
+        "approval_rate": posts_per_status.get("approved", 0) / reviewed if reviewed else None,
+        "rejection_rate": posts_per_status.get("rejected", 0) / reviewed if reviewed else None,
+        "rejection_reasons": rejection_reasons,
+    }
+
+# --- Fila de e-mails (outbox) ---
+def enqueue_email(post_id: int, session_id: str, subject: str, body: str) -> int:
+    """
+    Grava o e-mail de aprovação do post na fila. Se o post já tem um e-mail na fila, não grava
+    outro e retorna o id do existente.
+    """
+    with pool.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO email_outbox (post_id, session_id, subject, body, next_attempt_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(post_id) DO NOTHING",
+            (post_id, session_id, subject, body, time.time())
+        )
+        if cursor.rowcount:
+            return cursor.lastrowid
+        return cursor.execute("SELECT id FROM email_outbox WHERE post_id = ?", (post_id,)).fetchone()[0]
+
+def fetch_due_emails(limit: int) -> list[dict]:
+    rows = pool.connection().execute(
+        "SELECT id, post_id, session_id, subject, body, attempts FROM email_outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+        (time.time(), limit)
+    ).fetchall()
+    return [
+        {"id": row[0], "post_id": row[1], "session_id": row[2], "subject": row[3], "body": row[4], "attempts": row[5]}
+        for row in rows
+    ]
+
+def mark_emails_sent(email_ids: list[int]):
+    with pool.transaction() as cursor:
+        cursor.executemany(
+            "UPDATE email_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?, last_error = NULL WHERE id = ?",
+            [(datetime.datetime.now(), email_id) for email_id in email_ids]
+        )
+
+def mark_emails_failed(failures: list[tuple[int, float, bool]], error: str):
+    """
+    Registra uma tentativa falha de cada e-mail. `failures` traz (id, próxima tentativa, desistir)
+    por e-mail, pois os e-mails de um digest podem estar em tentativas diferentes.
+    """
+    with pool.transaction() as cursor:
+        cursor.executemany(
+            "UPDATE email_outbox SET status = ?, attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            [("failed" if give_up else "pending", error, next_attempt_at, email_id) for email_id, next_attempt_at, give_up in failures]
+        )
@@ -0,0 +1,132 @@
+import threading
+from typing import Callable
+
+from src import database, tracing
+from src.models import DraftPoolProfile
+
+
+class DraftPool:
+    """
+    Mantém `size` rascunhos prontos por perfil (tom, tamanho e CTA) em uma thread de
+    background, para que /generate_post devolva um post sem esperar o Gemini. Os rascunhos
+    ficam em posts com status 'pooled' e sobrevivem a reinícios; cada retirada acorda a
+    thread para repor o pool.
+
+    `produce(perfil)` gera um rascunho e retorna (tópico, post_data), ou None quando não há
+    tópico livre ou o Gemini está indisponível; nesse caso a thread espera `retry_delay`.
+    """
+
+    def __init__(
+        self,
+        profiles: list[DraftPoolProfile],
+        size: int,
+        produce: Callable[[DraftPoolProfile], tuple[str, dict] | None],
+        poll_interval: float = 60.0,
+        retry_delay: float = 10.0,
+    ):
+        self.profiles = {profile.key: profile for profile in profiles}
+        self.size = size
+        self.produce = produce
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.produced = 0
+        self.claims: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- Ciclo de vida ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="draft-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wake.set()
+
+    # --- Retirada ---
+    def match(self, tone: str, length: int, call_to_action: str) -> DraftPoolProfile | None:
+        return self.profiles.get(DraftPoolProfile(tone=tone, length=length, call_to_action=call_to_action).key)
+
+    def claim(self, profile: DraftPoolProfile, session_id: str) -> dict | None:
+        """
+        Retira o rascunho mais antigo do perfil como post 'pending' da sessão e pede a reposição.
+        Retorna None se o pool do perfil estiver vazio.
+        """
+        draft = database.claim_pooled_draft(profile.key, session_id)
+        with self._lock:
+            counters = self.claims if draft else self.misses
+            counters[profile.key] = counters.get(profile.key, 0) + 1
+        self.wake()
+        return draft
+
+    # --- Reposição ---
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                full = self.refill()
+            except Exception as e:
+                print(f"Erro ao repor o pool de rascunhos: {e}")
+                full = False
+            self._wake.wait(self.poll_interval if full else self.retry_delay)
+            self._wake.clear()
+
+    def refill(self) -> bool:
+        """
+        Gera rascunhos um a um, sempre para o perfil com mais vagas, até completar o pool.
+        Retorna False se uma geração falhar antes disso.
+        """
+        while not self._stop.is_set():
+            ready = database.count_pooled_drafts()
+            missing = {key: self.size - ready.get(key, 0) for key in self.profiles}
+            key = max(missing, key=missing.get, default=None)
+            if key is None or missing[key] <= 0:
+                return True
+            result = self.produce(self.profiles[key])
+            if result is None:
+                return False
+            topic, post_data = result
+            database.insert_pooled_draft(topic, post_data, key)
+            with self._lock:
+                self.produced += 1
+        return True
+
+    def snapshot(self) -> dict:
+        ready = database.count_pooled_drafts()
+        with self._lock:
+            return {
+                "size": self.size,
+                "produced": self.produced,
+                "profiles": {
+                    key: {
+                        **profile.model_dump(),
+                        "ready": ready.get(key, 0),
+                        "claims": self.claims.get(key, 0),
+                        "misses": self.misses.get(key, 0),
+                    }
+                    for key, profile in self.profiles.items()
+                },
+            }
+
+    def register_metrics(self, prefix: str, stats: tracing.StageStats = tracing.stats):
+        """
+        Expõe os rascunhos prontos, as retiradas e os rascunhos gerados no /internal/stats.
+        """
+        stats.register(f"{prefix}_ready", "gauge", "Rascunhos prontos no pool por perfil.",
+                       lambda: [({"profile": key}, value["ready"]) for key, value in self.snapshot()["profiles"].items()])
+        stats.register(f"{prefix}_claims_total", "counter", "Pedidos atendidos pelo pool (hit) ou com o pool do perfil vazio (miss).",
+                       lambda: [({"profile": key, "result": result}, value[field])
+                                for key, value in self.snapshot()["profiles"].items()
+                                for result, field in (("hit", "claims"), ("miss", "misses"))])
+        stats.register(f"{prefix}_produced_total", "counter", "Rascunhos gerados para o pool.",
+                       lambda: [({}, self.produced)])
@@ -0,0 +1,47 @@
+import threading
+from collections import deque
+
+
+class GenerationStats:
+    """
+    Latência e número de chamadas ao modelo por modo de geração ("team", "pipeline" ou "pool"),
+    para comparar os dois caminhos em /metrics. Guarda só as últimas `window`
+    latências de cada modo para os percentis.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._modes: dict[str, dict] = {}
+
+    def record(self, mode: str, latency: float, model_calls: int, cache_hit: bool = False, fallback: bool = False):
+        with self._lock:
+            stats = self._modes.setdefault(mode, {
+                "requests": 0, "model_calls": 0, "cache_hits": 0, "fallbacks": 0,
+                "latencies": deque(maxlen=self.window),
+            })
+            stats["requests"] += 1
+            stats["model_calls"] += model_calls
+            stats["cache_hits"] += int(cache_hit)
+            stats["fallbacks"] += int(fallback)
+            stats["latencies"].append(latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            modes = {mode: {**stats, "latencies": sorted(stats["latencies"])} for mode, stats in self._modes.items()}
+        result = {}
+        for mode, stats in modes.items():
+            latencies = stats.pop("latencies")
+            result[mode] = {
+                **stats,
+                "model_calls_per_request": round(stats["model_calls"] / stats["requests"], 2),
+                "latency_avg_ms": round(1000 * sum(latencies) / len(latencies), 1),
+                "latency_p50_ms": round(1000 * _percentile(latencies, 0.50), 1),
+                "latency_p95_ms": round(1000 * _percentile(latencies, 0.95), 1),
+            }
+        return result
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
@@ -0,0 +1,79 @@
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+class QueueFullError(Exception):
+    """
+    Levantada quando a fila de jobs atingiu o limite de jobs pendentes.
+    """
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Any
+    status: str = "queued"  # queued | running | done | failed
+    result: Any = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+
+class JobQueue:
+    """
+    Fila de jobs em memória executada por um pool limitado de workers (threads),
+    mantendo o event loop do FastAPI livre enquanto o Team conversa com o Gemini.
+    """
+
+    def __init__(self, worker: Callable[[Any], Any], max_workers: int = 4, max_pending: int = 100, result_ttl: int = 3600):
+        self._worker = worker
+        self._max_pending = max_pending
+        self._result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-worker")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, payload: Any) -> Job:
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+            if pending >= self._max_pending:
+                raise QueueFullError(f"Fila de geração cheia ({pending} jobs pendentes).")
+            job = Job(id=uuid.uuid4().hex, payload=payload)
+            self._jobs[job.id] = job
+        # Copia o contexto (trace da requisição, bypass do cache) para a thread do worker
+        self._executor.submit(contextvars.copy_context().run, self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = self._worker(job.payload)
+            job.status = "done"
+        except Exception as e:
+            print(f"Job {job.id} falhou: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        # Remove jobs finalizados há mais de result_ttl segundos
+        cutoff = time.time() - self._result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,138 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from typing import Callable
+
+from src import tracing
+from src.database import ConnectionPool
+
+# Permite ignorar o cache em uma requisição específica (propaga para as ferramentas dos agentes)
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+class LLMCache:
+    """
+    Cache persistente de respostas do LLM, endereçado pelo hash do modelo,
+    do prompt renderizado e do estado relevante. Cada entrada tem TTL próprio
+    e o tamanho é limitado por despejo LRU (last_access mais antigo).
+
+    Entradas expiradas continuam no banco por `stale_grace` segundos e só são
+    devolvidas por `get_stale`, usado quando o Gemini está indisponível.
+    """
+
+    def __init__(self, db_file: str = "tmp/llm_cache.db", default_ttl: int = 86400, max_entries: int = 1000, stale_grace: int = 604800):
+        self.db_file = db_file
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.stale_grace = stale_grace
+        self.pool = ConnectionPool(db_file)
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def init_db(self):
+        with self.pool.transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, state: dict | None = None) -> str:
+        payload = json.dumps([model_id, prompt, state or {}], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def bypass(enabled: bool = True):
+        """
+        Desativa o cache (leitura e escrita) dentro do bloco.
+        """
+        token = _bypass.set(enabled)
+        try:
+            yield
+        finally:
+            _bypass.reset(token)
+
+    def get(self, namespace: str, key: str, accept: Callable[[str], bool] | None = None) -> str | None:
+        """
+        Valor da chave, se ainda válido. Se `accept` recusar o valor encontrado (ex.: rascunho
+        que já virou um post), a consulta conta como miss e o span fica marcado com discarded.
+        """
+        with tracing.span("cache_lookup", namespace=namespace) as span:
+            if _bypass.get():
+                self._count(namespace, "bypass")
+                span.set(cache_hit=False)
+                return None
+            value = self._get(key)
+            if value is not None and accept and not accept(value):
+                self._count(namespace, "discarded")
+                span.set(discarded=True)
+                value = None
+            self._count(namespace, "hits" if value is not None else "misses")
+            span.set(cache_hit=value is not None)
+        return value
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        conn = self.pool.connection()
+        row = conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row and row[1] > now:
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+        if row and row[1] + self.stale_grace <= now:
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        return None
+
+    def get_stale(self, namespace: str, key: str) -> str | None:
+        """
+        Devolve a entrada mesmo expirada (dentro de stale_grace), para servir um rascunho
+        anterior quando o Gemini está indisponível.
+        """
+        if _bypass.get():
+            return None
+        row = self.pool.connection().execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires_at + ? > ?", (key, self.stale_grace, time.time())
+        ).fetchone()
+        if row:
+            self._count(namespace, "stale")
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, model_id: str, value: str, ttl: int | None = None):
+        if _bypass.get():
+            return
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        with self.pool.transaction() as cursor:
+            cursor.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, model_id, value, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, model_id, value, now, now + ttl, now)
+            )
+            # Remove os expirados além da tolerância e aplica o limite de tamanho por LRU
+            cursor.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now - self.stale_grace,))
+            cursor.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def stats(self) -> dict:
+        entries = self.pool.connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        with self._lock:
+            counters = {namespace: dict(values) for namespace, values in self._counters.items()}
+        return {"entries": entries, "max_entries": self.max_entries, "counters": counters}
+
+    def _count(self, namespace: str, counter: str):
+        with self._lock:
+            values = self._counters.setdefault(namespace, {"hits": 0, "misses": 0, "bypass": 0, "stale": 0, "discarded": 0})
+            values[counter] += 1
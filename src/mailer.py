@@ -0,0 +1,183 @@
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from textwrap import dedent
+
+from src import database, tracing
+
+
+def render_approval_email(post_id: int, title: str, content: str, hashtags: list[str], session_id: str, base_url: str) -> tuple[str, str]:
+    """
+    Monta (assunto, corpo) do e-mail de aprovação de um post.
+    """
+    body = dedent(f"""\
+        Novo post gerado para o LinkedIn (Sessão: {session_id})
+
+        Título: {title}
+        Conteúdo: {content}
+        Hashtags: {' '.join(hashtags)}
+
+        Acesse os links abaixo para aprovar ou rejeitar:
+        Aprovar: {base_url}/approve_post/{post_id}
+        Rejeitar: {base_url}/reject_post/{post_id}?reason=motivo
+        (Para rejeitar, substitua 'motivo' no link pelo motivo da rejeição, ex.: 'muito genérico')
+    """)
+    return f"Novo Post LinkedIn - {title}", body
+
+
+class OutboxSender:
+    """
+    Drena a tabela email_outbox em uma thread de background, reaproveitando
+    uma única conexão SMTP autenticada entre mensagens. Falhas são reagendadas
+    com backoff exponencial; no modo digest, os e-mails pendentes são
+    agrupados em uma única mensagem.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        user: str,
+        password: str,
+        starttls: bool = True,
+        poll_interval: float = 2.0,
+        max_attempts: int = 5,
+        backoff_base: float = 5.0,
+        backoff_max: float = 600.0,
+        digest: bool = False,
+        digest_max: int = 20,
+        idle_timeout: float = 60.0,
+    ):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.digest = digest
+        self.digest_max = digest_max
+        self.idle_timeout = idle_timeout
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- Ciclo de vida ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._close()
+
+    def wake(self):
+        """
+        Pede para a fila ser drenada imediatamente (ignorado no modo digest, que espera a janela).
+        """
+        if not self.digest:
+            self._wake.set()
+
+    def enqueue(self, post_id: int, title: str, content: str, hashtags: list[str], session_id: str, base_url: str) -> int:
+        subject, body = render_approval_email(post_id, title, content, hashtags, session_id, base_url)
+        email_id = database.enqueue_email(post_id, session_id, subject, body)
+        self.wake()
+        return email_id
+
+    # --- Loop de envio ---
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.drain()
+            except Exception as e:
+                print(f"Erro ao drenar a fila de e-mails: {e}")
+                sent = 0
+            if sent:
+                continue
+            if self._smtp and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def drain(self) -> int:
+        """
+        Envia os e-mails vencidos. Retorna a quantidade de e-mails da fila processados com sucesso.
+        """
+        emails = database.fetch_due_emails(self.digest_max if self.digest else 1)
+        if not emails:
+            return 0
+        if self.digest and len(emails) > 1:
+            subject = f"{len(emails)} novos posts LinkedIn aguardando aprovação"
+            body = "\n\n----------------------------------------\n\n".join(email["body"] for email in emails)
+        else:
+            subject, body = emails[0]["subject"], emails[0]["body"]
+        email_ids = [email["id"] for email in emails]
+
+        try:
+            self._send(subject, body)
+        except Exception as e:
+            # Backoff e desistência por e-mail: um digest mistura e-mails em tentativas diferentes
+            now = time.time()
+            failures = []
+            for email in emails:
+                attempts = email["attempts"] + 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+                failures.append((email["id"], now + delay, attempts >= self.max_attempts))
+                print(f"Erro ao enviar e-mail {email['id']} (tentativa {attempts}/{self.max_attempts}): {e}")
+            database.mark_emails_failed(failures, str(e))
+            return 0
+
+        database.mark_emails_sent(email_ids)
+        return len(email_ids)
+
+    # --- Conexão SMTP reaproveitada ---
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except (smtplib.SMTPException, OSError):
+                self._close()
+        with tracing.span("smtp_connect"):
+            smtp = smtplib.SMTP(self.server, self.port, timeout=30)
+            if self.starttls:
+                smtp.starttls()
+            smtp.ehlo_or_helo_if_needed()
+            # Servidores locais de teste (aiosmtpd, debugging server) não anunciam AUTH
+            if self.user and self.password and smtp.has_extn("auth"):
+                smtp.login(self.user, self.password)
+        self._smtp = smtp
+        return smtp
+
+    def _send(self, subject: str, body: str):
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = self.user
+        msg['To'] = self.user
+        with tracing.span("smtp_send"):
+            try:
+                self._connection().sendmail(self.user, self.user, msg.as_string())
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # A conexão reaproveitada pode ter caído; tenta uma vez com uma conexão nova
+                self._close()
+                self._connection().sendmail(self.user, self.user, msg.as_string())
+        self._last_used = time.monotonic()
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
@@ -1,20 +1,30 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 import os
-import sqlite3
+import asyncio
+import contextlib
+import csv
+import io
+import queue
+import threading
 import datetime
-import smtplib
-from email.mime.text import MIMEText
-from agno.agent import Agent
-from agno.storage.sqlite import SqliteStorage
-from agno.models.google import Gemini
-from agno.team.team import Team
-from agno.tools import tool
-from rich.pretty import pprint
 from textwrap import dedent
 import json
 import time
+import orjson
+from src.jobs import JobQueue, QueueFullError
+from src.ratelimit import GeminiRateLimiter, count_calls
+from src.llm_cache import LLMCache
+from src import database, tracing
+from src.mailer import OutboxSender
+from src.models import DEFAULT_TOPIC, DraftPoolProfile, GeneratePostRequest, PostDraft, PostListResponse, PostResponse, GeneratePostBatchRequest, JobResponse, MetricsResponse, ModeratePostsRequest, ModeratePostsResponse, ModerationResult
+from src.similarity import SimilarityIndex
+from src.generation_stats import GenerationStats
+from src.resilience import CircuitBreaker, Hedger, ResilientCaller, RetryPolicy
+from src.draft_pool import DraftPool
+from src.sessions import SessionCache
 
 # Carrega as variáveis de ambiente
 load_dotenv(dotenv_path="../config/.env")
@@ -45,404 +55,928 @@ try:
 except ValueError:
     raise ValueError("SMTP_PORT deve ser um número inteiro válido. Verifique o arquivo config/.env")
 
-# --- Modelos Pydantic ---
-class GeneratePostRequest(BaseModel):
-    topic: str = "Um tópico relevante sobre Ciência de Dados, CRM ou IA."
-    tone: str = "profissional e direto"
-    length: int = 1500  # Atualizado para refletir o tamanho do post exemplo
-    call_to_action: str = "O que você acha? Compartilhe sua opinião!"
-    session_id: str = "default_session"
-
-class PostResponse(BaseModel):
-    id: int
-    title: str
-    content: str
-    hashtags: list[str]
-    status: str = "pending"
-    rejection_reason: str | None = None
-    created_at: str
-
-class MetricsResponse(BaseModel):
-    posts_per_week: dict
-    popular_topics: list
-    status: str = "success"
+# Configurações da fila de e-mails de aprovação
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_DIGEST = os.getenv("SMTP_DIGEST", "false").lower() in ("1", "true", "yes")
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+try:
+    SMTP_MAX_ATTEMPTS = int(os.getenv("SMTP_MAX_ATTEMPTS", "5"))
+    SMTP_DIGEST_MAX = int(os.getenv("SMTP_DIGEST_MAX", "20"))
+    SMTP_POLL_INTERVAL = float(os.getenv("SMTP_POLL_INTERVAL", "60" if SMTP_DIGEST else "2"))
+except ValueError:
+    raise ValueError("SMTP_MAX_ATTEMPTS, SMTP_DIGEST_MAX e SMTP_POLL_INTERVAL devem ser números válidos. Verifique o arquivo config/.env")
+
+outbox_sender = OutboxSender(
+    server=SMTP_SERVER,
+    port=SMTP_PORT,
+    user=SMTP_USER,
+    password=SMTP_PASSWORD,
+    starttls=SMTP_STARTTLS,
+    poll_interval=SMTP_POLL_INTERVAL,
+    max_attempts=SMTP_MAX_ATTEMPTS,
+    digest=SMTP_DIGEST,
+    digest_max=SMTP_DIGEST_MAX,
+)
+
+# Detecção de quase-duplicatas de tópicos e posts
+try:
+    DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.5"))
+    PROMPT_PRIOR_TOPICS = int(os.getenv("PROMPT_PRIOR_TOPICS", "10"))
+except ValueError:
+    raise ValueError("DUPLICATE_THRESHOLD e PROMPT_PRIOR_TOPICS devem ser números válidos. Verifique o arquivo config/.env")
+
+# Índice carregado do banco na primeira consulta (ou no aquecimento em background do startup)
+topic_index = SimilarityIndex(loader=database.fetch_similarity_corpus, threshold=DUPLICATE_THRESHOLD)
+
+class DuplicateTopicError(Exception):
+    """
+    Levantada quando o tópico pedido é quase-duplicata de um post anterior e on_duplicate='reject'.
+    """
+
+# Modo de inicialização dos agentes: "lazy" (na primeira geração) ou "eager" (no startup)
+AGENT_INIT_MODE = os.getenv("AGENT_INIT_MODE", "lazy").lower()
+if AGENT_INIT_MODE not in ("lazy", "eager"):
+    raise ValueError("AGENT_INIT_MODE deve ser 'lazy' ou 'eager'. Verifique o arquivo config/.env")
+
+# Cache LRU dos agentes por sessão: máximo de sessões em memória, memória estimada total (MB)
+# e contextos livres guardados por sessão (pedidos simultâneos da mesma sessão usam contextos diferentes)
+try:
+    AGENT_SESSION_CACHE_SIZE = int(os.getenv("AGENT_SESSION_CACHE_SIZE", "100"))
+    AGENT_SESSION_CACHE_MB = float(os.getenv("AGENT_SESSION_CACHE_MB", "64"))
+    AGENT_SESSION_IDLE_CONTEXTS = int(os.getenv("AGENT_SESSION_IDLE_CONTEXTS", "4"))
+except ValueError:
+    raise ValueError("AGENT_SESSION_CACHE_SIZE, AGENT_SESSION_CACHE_MB e AGENT_SESSION_IDLE_CONTEXTS devem ser números válidos. Verifique o arquivo config/.env")
+
+# Modo de geração: "team" (Team em modo coordinate) ou "pipeline" (tópico escolhido localmente e uma única chamada estruturada ao modelo)
+GENERATION_MODE = os.getenv("GENERATION_MODE", "team").lower()
+if GENERATION_MODE not in ("team", "pipeline"):
+    raise ValueError("GENERATION_MODE deve ser 'team' ou 'pipeline'. Verifique o arquivo config/.env")
+
+generation_stats = GenerationStats()
+
+# Configurações do pool de geração assíncrona
+try:
+    GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+    GENERATION_QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", "100"))
+except ValueError:
+    raise ValueError("GENERATION_WORKERS e GENERATION_QUEUE_SIZE devem ser números inteiros válidos. Verifique o arquivo config/.env")
+
+# Limites de chamadas ao Gemini e tamanho máximo de lote
+try:
+    GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+except ValueError:
+    raise ValueError("GEMINI_RPM, GEMINI_MAX_CONCURRENCY e MAX_BATCH_SIZE devem ser números inteiros válidos. Verifique o arquivo config/.env")
+
+# Máximo de ações por chamada de POST /posts/moderate
+try:
+    MAX_MODERATION_BATCH = int(os.getenv("MAX_MODERATION_BATCH", "1000"))
+except ValueError:
+    raise ValueError("MAX_MODERATION_BATCH deve ser um número inteiro válido. Verifique o arquivo config/.env")
+
+# Segundos que um tópico escolhido do banco fica reservado para a geração que o escolheu
+try:
+    TOPIC_RESERVATION_TTL = float(os.getenv("TOPIC_RESERVATION_TTL", "600"))
+except ValueError:
+    raise ValueError("TOPIC_RESERVATION_TTL deve ser um número válido. Verifique o arquivo config/.env")
+
+# Aplicado em cada requisição ao Gemini pelos modelos criados em new_model
+gemini_limiter = GeminiRateLimiter(requests_per_minute=GEMINI_RPM, max_concurrent=GEMINI_MAX_CONCURRENCY)
+
+# Retry com backoff, circuit breaker compartilhado e hedging opcional (0 desativa) das chamadas ao Gemini
+try:
+    GEMINI_RETRY_ATTEMPTS = int(os.getenv("GEMINI_RETRY_ATTEMPTS", "3"))
+    GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1"))
+    GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))
+    GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+    GEMINI_BREAKER_RECOVERY = float(os.getenv("GEMINI_BREAKER_RECOVERY", "30"))
+    GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0"))
+except ValueError:
+    raise ValueError("GEMINI_RETRY_ATTEMPTS, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY, GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RECOVERY e GEMINI_HEDGE_PERCENTILE devem ser números válidos. Verifique o arquivo config/.env")
+
+gemini_caller = ResilientCaller(
+    policy=RetryPolicy(max_attempts=GEMINI_RETRY_ATTEMPTS, base_delay=GEMINI_RETRY_BASE_DELAY, max_delay=GEMINI_RETRY_MAX_DELAY),
+    breaker=CircuitBreaker(failure_threshold=GEMINI_BREAKER_THRESHOLD, recovery_timeout=GEMINI_BREAKER_RECOVERY),
+    hedger=Hedger(GEMINI_HEDGE_PERCENTILE, max_workers=2 * GEMINI_MAX_CONCURRENCY) if GEMINI_HEDGE_PERCENTILE else None,
+)
+gemini_caller.register_metrics("linkedin_gemini")
+
+# Cache persistente das respostas do LLM (tópicos e rascunhos de posts)
+try:
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+    LLM_CACHE_STALE_GRACE = int(os.getenv("LLM_CACHE_STALE_GRACE", "604800"))
+except ValueError:
+    raise ValueError("LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES e LLM_CACHE_STALE_GRACE devem ser números inteiros válidos. Verifique o arquivo config/.env")
+
+llm_cache = LLMCache(db_file="tmp/llm_cache.db", default_ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES, stale_grace=LLM_CACHE_STALE_GRACE)
+
+# Pool de rascunhos pré-gerados para /generate_post: rascunhos por perfil (0 desativa) e perfis em JSON
+# (lista de {"tone", "length", "call_to_action"}; campos omitidos usam os padrões de GeneratePostRequest)
+try:
+    DRAFT_POOL_SIZE = int(os.getenv("DRAFT_POOL_SIZE", "0"))
+    DRAFT_POOL_PROFILES = [DraftPoolProfile(**profile) for profile in json.loads(os.getenv("DRAFT_POOL_PROFILES", "[{}]"))]
+    DRAFT_POOL_RETRY_DELAY = float(os.getenv("DRAFT_POOL_RETRY_DELAY", "10"))
+except (ValueError, TypeError):
+    raise ValueError("DRAFT_POOL_SIZE e DRAFT_POOL_RETRY_DELAY devem ser números válidos e DRAFT_POOL_PROFILES uma lista JSON de perfis. Verifique o arquivo config/.env")
+
+# Rastreamento por etapa: cabeçalho com o id do trace ("" desativa) e limite para logar requisições lentas (0 desativa)
+TRACE_ID_HEADER = os.getenv("TRACE_ID_HEADER", "X-Trace-Id")
+try:
+    TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "10000"))
+except ValueError:
+    raise ValueError("TRACE_SLOW_MS deve ser um número válido. Verifique o arquivo config/.env")
 
 # --- Inicializa o banco de tópicos e posts ---
-def init_db(db_file="tmp/linkedin.db"):
+def init_db():
     """
-    Cria as tabelas de tópicos e posts, populando com 50 tópicos iniciais.
+    Cria as tabelas de tópicos e posts e, se o banco estiver vazio, popula os tópicos
+    a partir do arquivo de seed (sem chamar o LLM).
     """
-    os.makedirs("tmp", exist_ok=True)
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS topics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic TEXT NOT NULL,
-            usage_count INTEGER DEFAULT 0,
-            last_used TIMESTAMP
-        )
-    """)
+    database.init_schema()
     
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            title TEXT,
-            content TEXT,
-            hashtags TEXT,
-            status TEXT DEFAULT 'pending',
-            rejection_reason TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("SELECT COUNT(*) FROM topics")
-    count = cursor.fetchone()[0]
-    
-    if count < 50:
-        topics = get_trending_topics.entrypoint(agent=None, area_of_interest="Ciência de Dados, CRM ou IA")
-        topic_list = topics.strip().split('\n') * 10
-        topic_list = topic_list[:50]
-        for topic in topic_list:
-            cursor.execute("INSERT INTO topics (topic, usage_count) VALUES (?, 0)", (topic,))
-    
-    conn.commit()
-    conn.close()
+    if database.count_topics() == 0:
+        database.insert_topics(database.load_seed_topics())
+
+# --- Agentes por sessão, construídos sob demanda ---
+_agent_storages = None
+_agent_storages_lock = threading.Lock()
+
+def get_agent_storages():
+    """
+    Retorna os SqliteStorage compartilhados pelas sessões, criando-os (e importando o agno) na primeira chamada.
+    """
+    global _agent_storages
+    if _agent_storages is None:
+        with _agent_storages_lock:
+            if _agent_storages is None:
+                from src.agents import build_storages
+                _agent_storages = build_storages()
+    return _agent_storages
+
+def new_model():
+    # Cada agente recebe o próprio modelo, todos sob o mesmo gemini_limiter
+    from src.agents import build_gemini
+    return build_gemini(gemini_limiter)
+
+def build_session_agents(session_id: str):
+    from src.agents import build_content_agents
+    return build_content_agents(
+        llm_cache, topic_index, PROMPT_PRIOR_TOPICS,
+        session_id=session_id, storages=get_agent_storages(), model_factory=new_model,
+    )
+
+# Cada pedido usa agentes e Team próprios da sua sessão: todos geram em paralelo, só os tópicos usados da sessão são atualizados em fila
+session_agents = SessionCache(
+    build=build_session_agents,
+    max_sessions=AGENT_SESSION_CACHE_SIZE,
+    max_bytes=int(AGENT_SESSION_CACHE_MB * 1024 * 1024),
+    size_of=lambda agents: agents.estimated_bytes(),
+    max_idle=AGENT_SESSION_IDLE_CONTEXTS,
+)
+session_agents.register_metrics("linkedin_agent_sessions")
+
+def warm_default_session():
+    # Importa o agno e constrói a sessão padrão antes do primeiro pedido
+    with session_agents.session(GeneratePostRequest().session_id):
+        pass
+
+# PostWriters livres do modo pipeline (sem estado de sessão): cada run usa uma instância só sua
+_post_writers: queue.SimpleQueue = queue.SimpleQueue()
+
+def new_post_writer():
+    from src.agents import build_post_writer
+    return build_post_writer(new_model())
+
+@contextlib.contextmanager
+def checkout_post_writer():
+    try:
+        writer = _post_writers.get_nowait()
+    except queue.Empty:
+        writer = new_post_writer()
+    try:
+        yield writer
+    finally:
+        _post_writers.put(writer)
 
 # --- Evento de inicialização do FastAPI ---
 @app.on_event("startup")
 async def startup_event():
     print("Iniciando banco de dados...")
+    llm_cache.init_db()
     init_db()
     print("Banco de dados inicializado.")
+    outbox_sender.start()
+    if draft_pool:
+        draft_pool.start()
+    threading.Thread(target=len, args=(topic_index,), name="topic-index-warmup", daemon=True).start()
+    if AGENT_INIT_MODE == "eager":
+        await run_in_threadpool(warm_default_session)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    generation_queue.shutdown()
+    if draft_pool:
+        draft_pool.stop()
+    if gemini_caller.hedger:
+        gemini_caller.hedger.shutdown()
+    outbox_sender.stop()
+    database.pool.close_all()
+    llm_cache.pool.close_all()
 
-# --- Ferramentas para os Agentes ---
-@tool
-def get_trending_topics(agent: Agent, area_of_interest: str = "Ciência de Dados, CRM ou IA") -> str:
+# --- Post padrão usado quando o Team não retorna conteúdo ---
+def build_fallback_post_data(topic: str, call_to_action: str) -> dict:
+    return {
+        "title": f"Como aproveitar {topic} em 2025",
+        "content": dedent(f"""\
+            ## Imagine o potencial de {topic} para sua empresa
+            
+            E se você pudesse transformar seus processos com {topic}? A pergunta que todo gestor faz é: como isso impacta meu negócio?
+            
+            ## Por que {topic} é estratégico?
+            Em 2025, {topic} está revolucionando empresas ao aumentar receita, reduzir custos e otimizar decisões. É a chave para se manter competitivo.
+            
+            ## Como implementar de forma prática
+            1. **Defina KPIs claros**: Foque em métricas como conversão ou eficiência.
+            2. **Teste com um MVP**: Implemente uma solução inicial para validar resultados.
+            3. **Meça o impacto**: Use ROI = [(Ganho - Custo) / Custo] x 100.
+            
+            ## Exemplos de sucesso
+            - Redução de 30% no tempo de processos com {topic}.
+            - Aumento de 25% na conversão de vendas com automação.
+            - Economia de R$ 200 mil/ano com otimização de recursos.
+            
+            ## Hora de agir
+            {call_to_action} Vamos conversar sobre como {topic} pode transformar seu negócio? Nos vemos na próxima semana!
+        """),
+        "hashtags": ["#IA", "#CRM", "#CiênciaDeDados", "#Automação", "#Inovação"],
+        "status": "pending"
+    }
+
+# --- Geração síncrona do conteúdo (executada fora do event loop) ---
+def parse_post_content(content: str) -> dict:
     """
-    Gera uma lista de 5 tópicos relevantes e em alta para posts de LinkedIn, evitando repetições com base no session_state.
+    Converte o JSON retornado pelo Team em post_data, descartando campos controlados pelo banco (id, created_at).
+    """
+    data = json.loads(content)
+    return {
+        "title": data["title"],
+        "content": data["content"],
+        "hashtags": list(data["hashtags"]),
+        "status": data.get("status", "pending"),
+    }
+
+def pick_fresh_topic() -> str | None:
+    """
+    Reserva o tópico menos usado do banco que não esteja em uso por outra geração ou por um
+    rascunho do pool, preferindo os que não são quase-duplicata de um post anterior (sem chamar o LLM).
+    """
+    return database.reserve_topic(lambda candidate: not topic_index.find_duplicate(candidate), ttl=TOPIC_RESERVATION_TTL)
+
+def resolve_topic(request: GeneratePostRequest) -> GeneratePostRequest:
+    """
+    Verifica se o tópico pedido é quase-duplicata de um post anterior antes de qualquer chamada ao LLM.
+    Conforme on_duplicate, rejeita ou troca pelo tópico menos usado que não seja duplicata.
+    """
+    if request.topic == DEFAULT_TOPIC or request.on_duplicate == "allow":
+        return request
+    duplicate = topic_index.find_duplicate(request.topic)
+    if not duplicate:
+        return request
+    if request.on_duplicate == "reject":
+        raise DuplicateTopicError(f"O tópico '{request.topic}' é muito parecido com '{duplicate[0]}' (similaridade {duplicate[1]:.2f}).")
+    candidate = pick_fresh_topic()
+    if candidate:
+        print(f"Tópico '{request.topic}' repetido; usando '{candidate}'.")
+        return request.model_copy(update={"topic": candidate})
+    # Sem tópico livre no banco: o TopicAgent escolhe um novo
+    return request.model_copy(update={"topic": DEFAULT_TOPIC})
+
+def generate_post_data(request: GeneratePostRequest) -> tuple[str, dict]:
+    """
+    Gera o conteúdo do post sem persistir, pelo caminho de GENERATION_MODE.
+    Retorna (tópico, post_data); o e-mail de aprovação é enfileirado pelo finalize_post.
+    """
+    request = resolve_topic(request)
+    usage = {"model_calls": 0, "cache_hit": False, "fallback": False}
+    started = time.perf_counter()
+    with LLMCache.bypass(request.bypass_cache), count_calls() as calls:
+        if GENERATION_MODE == "pipeline":
+            result = _generate_post_data_pipeline(request, usage)
+        else:
+            result = _generate_post_data(request, usage)
+    usage["model_calls"] = calls.calls
+    generation_stats.record(GENERATION_MODE, time.perf_counter() - started, **usage)
+    return result
+
+def build_generation_prompt(request: GeneratePostRequest, content_team) -> tuple[str, str]:
+    """
+    Renderiza o prompt do Team e calcula a chave dele no cache (que inclui os tópicos já usados na sessão).
+    Retorna (prompt, cache_key).
     """
-    used_topics = agent.session_state.get("used_topics", []) if agent else []
-    
     prompt = dedent(f"""\
-        Você é um gerador de ideias de conteúdo para LinkedIn, focado em {area_of_interest}.
-        Gere 5 ideias de tópicos inovadores e práticos para gestores de negócios, evitando os seguintes tópicos já usados: {', '.join(used_topics) if used_topics else 'Nenhum'}.
-        Considere tendências de 2025 e temas como: KPIs de CRM, aplicações de IA, automação (ex.: SDR/BDR), personalização, previsão/preditivo, receita, faturamento, engajamento, fidelização, gestão estratégica.
-        Priorize palavras-chave: conversão, fidelização, receita, faturamento, engajamento, automação, KPIs, estratégico, gestão, previsão, preditivo.
-        Retorne apenas os títulos, uma por linha.
+        Gere um post para o LinkedIn sobre {request.topic}.
+        Use tom {request.tone}, aproximadamente {request.length} caracteres, e inclua o call-to_action: '{request.call_to_action}'.
     """)
-    
-    try:
-        response = agent.run(prompt, stream=False)
-        return response.content
-    except Exception as e:
-        print(f"Erro ao gerar tópicos: {e}")
-        return "\n".join([
-            "Como a IA generativa aumenta a receita no CRM em 2025",
-            "Automação de SDRs com IA para maior conversão",
-            "KPIs de CRM para gestão estratégica",
-            "Modelos preditivos para fidelização de clientes",
-            "Engajamento de clientes com personalização via IA"
-        ])
+    cache_key = llm_cache.make_key(content_team.model.id, prompt, {"used_topics": content_team.session_state.get("used_topics", [])})
+    return prompt, cache_key
 
-@tool(requires_confirmation=True)
-def send_post_for_approval(agent: Agent, post: PostResponse, session_id: str) -> str:
+def confirm_pending_approval(agents, response):
     """
-    Envia o post gerado por e-mail para aprovação.
+    Confirma a ferramenta de envio para aprovação se o ApprovalAgent estiver pausado e continua o
+    run dele. O Team do agno não retoma o run pausado de um membro (só o Agent tem continue_run),
+    então o post final passa a ser o que o ApprovalAgent devolve depois de enviar o e-mail.
     """
-    try:
-        msg = MIMEText(f"""
-        Novo post gerado para o LinkedIn (Sessão: {session_id})
-
-        Título: {post.title}
-        Conteúdo: {post.content}
-        Hashtags: {' '.join(post.hashtags)}
-
-        Acesse os links abaixo para aprovar ou rejeitar:
-        Aprovar: http://localhost:8000/approve_post/{post.id}
-        Rejeitar: http://localhost:8000/reject_post/{post.id}?reason=motivo
-        (Para rejeitar, substitua 'motivo' no link pelo motivo da rejeição, ex.: 'muito genérico')
-        """)
-        msg['Subject'] = f"Novo Post LinkedIn - {post.title}"
-        msg['From'] = SMTP_USER
-        msg['To'] = SMTP_USER
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_USER, SMTP_USER, msg.as_string())
-        return "E-mail de aprovação enviado com sucesso!"
-    except Exception as e:
-        return f"Erro ao enviar e-mail: {e}"
-
-# --- Função de Contexto para Tendências ---
-def get_external_trends() -> str:
-    return "Tendências de 2025: IA preditiva domina CRM, automação de vendas cresce 20%, foco em KPIs de receita."
-
-# --- Inicializa os Agentes ---
-topic_agent = Agent(
-    name="TopicAgent",
-    model=Gemini(id="gemini-1.5-flash"),
-    description="Você é um assistente especializado em gerar tópicos relevantes para posts no LinkedIn sobre Ciência de Dados, CRM e IA.",
-    instructions=dedent("""\
-        Sua tarefa é gerar tópicos relevantes para posts no LinkedIn, com base em tendências externas e histórico de sessões.
-        Use a ferramenta `get_trending_topics` para obter tópicos novos, evitando repetições com base nos tópicos usados: {used_topics}.
-        Tendências externas: {external_trends}
-        Retorne apenas o tópico selecionado.
-    """),
-    tools=[get_trending_topics],
-    storage=SqliteStorage(table_name="topic_agent_sessions", db_file="tmp/linkedin.db"),
-    session_state={"used_topics": [], "external_trends": get_external_trends()},
-    add_state_in_messages=True,
-    add_history_to_messages=True,
-    num_history_runs=3,
-    markdown=True,
-    show_tool_calls=True,
-)
+    if not agents.approval_agent.is_paused:
+        return response
+    for tool in agents.approval_agent.run_response.tools_requiring_confirmation:
+        if tool.tool_name == "send_post_for_approval":
+            print(f"Post aguardando aprovação: {tool.tool_args}")
+            tool.confirmed = True  # Simula aprovação automática para testes
+    with tracing.span("continue_run") as span:
+        approval = agents.approval_agent.continue_run(run_response=agents.approval_agent.run_response, stream=False)
+        tracing.record_run_metrics(approval, span)
+    if isinstance(approval.content, PostResponse):
+        response.content = approval.content.model_dump_json()
+    elif approval.content:
+        response.content = approval.content
+    return response
 
-approval_agent = Agent(
-    name="ApprovalAgent",
-    model=Gemini(id="gemini-1.5-flash"),
-    description="Você é um assistente especializado em gerar posts para LinkedIn e gerenciar aprovação.",
-    instructions=dedent("""\
-        Sua tarefa é gerar um post para LinkedIn com base no tópico fornecido: '{topic}'.
-        Siga este formato para criar um post profissional e estratégico, com tom {tone} e aproximadamente {length} caracteres:
-        
-        1. **Introdução com gancho**: Comece com uma pergunta ou cenário envolvente que conecte com as dores ou interesses de gestores de negócios.
-        2. **Contexto estratégico**: Explique por que o tópico é relevante, destacando benefícios como aumento de receita, redução de custos ou melhoria na tomada de decisão.
-        3. **Explicação prática**: Forneça um guia claro (ex.: passos, fórmula, checklist) para aplicar o conceito, com exemplos concretos (ex.: "Redução de 30% no tempo de análise").
-        4. **Exemplos de impacto**: Inclua 2-3 exemplos de resultados mensuráveis (ex.: percentuais de melhoria, economia financeira).
-        5. **Chamada à ação (CTA)**: Finalize com a CTA fornecida ('{call_to_action}') e um tom de continuidade (ex.: "Nos vemos na próxima semana!").
-        
-        Use parágrafos curtos, subtítulos em markdown (##) e linguagem clara. Inclua 3-5 hashtags relevantes baseadas no tópico (ex.: #IA, #ROI, #Automação).
-        Retorne o post no formato JSON com os campos: id, title, content, hashtags, status.
-    """),
-    tools=[send_post_for_approval],
-    storage=SqliteStorage(table_name="approval_agent_sessions", db_file="tmp/linkedin.db"),
-    session_state={"external_trends": get_external_trends()},
-    add_state_in_messages=True,
-    add_history_to_messages=True,
-    num_history_runs=3,
-    markdown=True,
-    show_tool_calls=True,
-    response_model=PostResponse,
-)
+def sync_used_topics(agents, session_id: str):
+    """
+    Copia para o Team deste contexto os tópicos usados mais recentes da sessão, que podem ter
+    sido atualizados por outro contexto da mesma sessão.
+    """
+    with session_agents.shared_state(session_id) as shared:
+        if "used_topics" in shared:
+            agents.content_team.session_state["used_topics"] = list(shared["used_topics"])
 
-# --- Inicializa o Team ---
-content_team = Team(
-    name="LinkedInContentTeam",
-    mode="coordinate",
-    model=Gemini(id="gemini-1.5-flash"),
-    members=[topic_agent, approval_agent],
-    instructions=[
-        "Collaborar para gerar um post no LinkedIn com base em um tópico relevante.",
-        "O TopicAgent deve selecionar um tópico usando `get_trending_topics`.",
-        "O ApprovalAgent deve gerar o post com base no tópico e enviá-lo para aprovação.",
-        "Retornar apenas a resposta final do ApprovalAgent no formato JSON.",
-    ],
-    storage=SqliteStorage(table_name="team_sessions", db_file="tmp/linkedin.db"),
-    session_state={"used_topics": [], "external_trends": get_external_trends()},
-    markdown=True,
-    show_members_responses=True,
-    enable_agentic_context=True,
-    add_datetime_to_instructions=True,
-)
+def remember_used_topic(agents, title: str, session_id: str):
+    """
+    Acrescenta o tópico usado à lista da sessão, mantendo só os mais recentes, e grava no storage
+    para que o estado sobreviva ao descarte da sessão do cache. A lista da sessão é a referência:
+    o run de outro contexto pode ter gravado uma cópia anterior dela.
+    """
+    with session_agents.shared_state(session_id) as shared:
+        used_topics = shared.setdefault("used_topics", list(agents.content_team.session_state.get("used_topics", [])))
+        used_topics.append(title)
+        del used_topics[:-PROMPT_PRIOR_TOPICS]
+        agents.content_team.session_state["used_topics"] = list(used_topics)
+        agents.content_team.write_to_storage(session_id=session_id)
 
-# --- Função auxiliar para salvar post no banco ---
-def save_post_to_db(topic: str, post_data: dict, session_id: str) -> int:
-    conn = sqlite3.connect("tmp/linkedin.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO posts (session_id, title, content, hashtags, status) VALUES (?, ?, ?, ?, ?)",
-        (session_id, post_data["title"], post_data["content"], str(post_data["hashtags"]), post_data.get("status", "pending"))
-    )
-    post_id = cursor.lastrowid
-    cursor.execute("UPDATE topics SET usage_count = usage_count + 1, last_used = ? WHERE topic = ?",
-                   (datetime.datetime.now(), topic))
-    conn.commit()
-    conn.close()
-    return post_id
+def fallback_post_data(request: GeneratePostRequest) -> tuple[str, dict]:
+    # Usa o tópico menos usado do banco com o template padrão
+    fallback_topic = database.least_used_topic() or request.topic
+    return fallback_topic, build_fallback_post_data(fallback_topic, request.call_to_action)
 
-# --- Endpoint para gerar post ---
-@app.post("/generate_post", response_model=PostResponse)
-async def generate_post(request: GeneratePostRequest):
-    max_retries = 3
-    retry_delay = 2  # segundos
+def cached_post_data(request: GeneratePostRequest, cache_key: str) -> dict | None:
+    """
+    Rascunho em cache para o prompt, descartado se o título for quase-duplicata de um post
+    já salvo (o mesmo rascunho não é servido de novo enquanto o TTL não expira). O descarte
+    conta como miss do cache, não como acerto.
+    """
+    def accept(cached: str) -> bool:
+        return request.on_duplicate == "allow" or not topic_index.find_duplicate(parse_post_content(cached)["title"])
     
-    for attempt in range(max_retries):
-        try:
+    cached = llm_cache.get("posts", cache_key, accept=accept)
+    return parse_post_content(cached) if cached else None
+
+def degraded_post_data(request: GeneratePostRequest, cache_key: str, usage: dict) -> tuple[str, dict]:
+    """
+    Sem o Gemini (circuito aberto ou tentativas esgotadas): serve o último rascunho em cache
+    para o mesmo prompt, mesmo expirado, e só então o post padrão.
+    """
+    usage["fallback"] = True
+    stale = llm_cache.get_stale("posts", cache_key)
+    if stale:
+        print("Usando rascunho anterior do cache.")
+        return request.topic, parse_post_content(stale)
+    return fallback_post_data(request)
+
+def _generate_post_data(request: GeneratePostRequest, usage: dict) -> tuple[str, dict]:
+    with session_agents.session(request.session_id) as agents:
+        sync_used_topics(agents, request.session_id)
+        content_team = agents.content_team
+        prompt, cache_key = build_generation_prompt(request, content_team)
+        post_data = cached_post_data(request, cache_key)
+        if post_data:
+            usage["cache_hit"] = True
+            remember_used_topic(agents, post_data["title"], request.session_id)
+            return request.topic, post_data
+        
+        def run_team():
             # Usa o Team para coordenar a geração do post
-            response = content_team.run(
-                dedent(f"""\
-                    Gere um post para o LinkedIn sobre {request.topic}.
-                    Use tom {request.tone}, aproximadamente {request.length} caracteres, e inclua o call-to_action: '{request.call_to_action}'.
-                """),
-                session_id=request.session_id
-            )
+            with tracing.span("team_run") as span:
+                response = content_team.run(prompt, session_id=request.session_id, stream=False)
+                tracing.record_run_metrics(response, span)
             
             # Verifica se o ApprovalAgent está pausado para confirmação
-            if approval_agent.is_paused:
-                for tool in approval_agent.run_response.tools_requiring_confirmation:
-                    if tool.tool_name == "send_post_for_approval":
-                        print(f"Post aguardando aprovação: {tool.tool_args}")
-                        tool.confirmed = True  # Simula aprovação automática para testes
-                response = content_team.continue_run()
+            return confirm_pending_approval(agents, response)
+        
+        try:
+            # O Team grava a sessão: não é idempotente, então não usa hedging
+            response = gemini_caller.call(run_team)
             
             # Extrai o post gerado
-            post_data = json.loads(response.content) if response.content else {
-                "title": f"Como aproveitar {request.topic} em 2025",
-                "content": dedent(f"""\
-                    ## Imagine o potencial de {request.topic} para sua empresa
-                    
-                    E se você pudesse transformar seus processos com {request.topic}? A pergunta que todo gestor faz é: como isso impacta meu negócio?
-                    
-                    ## Por que {request.topic} é estratégico?
-                    Em 2025, {request.topic} está revolucionando empresas ao aumentar receita, reduzir custos e otimizar decisões. É a chave para se manter competitivo.
-                    
-                    ## Como implementar de forma prática
-                    1. **Defina KPIs claros**: Foque em métricas como conversão ou eficiência.
-                    2. **Teste com um MVP**: Implemente uma solução inicial para validar resultados.
-                    3. **Meça o impacto**: Use ROI = [(Ganho - Custo) / Custo] x 100.
-                    
-                    ## Exemplos de sucesso
-                    - Redução de 30% no tempo de processos com {request.topic}.
-                    - Aumento de 25% na conversão de vendas com automação.
-                    - Economia de R$ 200 mil/ano com otimização de recursos.
-                    
-                    ## Hora de agir
-                    {request.call_to_action} Vamos conversar sobre como {request.topic} pode transformar seu negócio? Nos vemos na próxima semana!
-                """),
-                "hashtags": ["#IA", "#CRM", "#CiênciaDeDados", "#Automação", "#Inovação"],
-                "status": "pending"
-            }
-            post_id = save_post_to_db(request.topic, post_data, request.session_id)
-            post = PostResponse(id=post_id, created_at=datetime.datetime.now().isoformat(), **post_data)
+            if response.content:
+                post_data = parse_post_content(response.content)
+                llm_cache.set("posts", cache_key, content_team.model.id, response.content)
+            else:
+                post_data = build_fallback_post_data(request.topic, request.call_to_action)
+            remember_used_topic(agents, post_data["title"], request.session_id)
             
-            # Atualiza o session_state do team com o tópico usado
-            content_team.session_state["used_topics"].append(post_data["title"])
-            
-            # Exibe métricas do run
-            print("--- Métricas do Team ---")
-            pprint(response.metrics)
-            
-            return post
+            return request.topic, post_data
         
         except Exception as e:
-            print(f"Tentativa {attempt + 1}/{max_retries} falhou: {str(e)}")
-            if "503" in str(e) and attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                continue
-            # Fallback em caso de falha após todas as tentativas
-            print(f"Falha após {max_retries} tentativas. Usando post padrão.")
-            conn = sqlite3.connect("tmp/linkedin.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT topic FROM topics ORDER BY usage_count ASC LIMIT 1")
-            topic = cursor.fetchone()
-            conn.close()
-            fallback_topic = topic[0] if topic else request.topic
-            post_data = {
-                "title": f"Como aproveitar {fallback_topic} em 2025",
-                "content": dedent(f"""\
-                    ## Imagine o potencial de {fallback_topic} para sua empresa
-                    
-                    E se você pudesse transformar seus processos com {fallback_topic}? A pergunta que todo gestor faz é: como isso impacta meu negócio?
-                    
-                    ## Por que {fallback_topic} é estratégico?
-                    Em 2025, {fallback_topic} está revolucionando empresas ao aumentar receita, reduzir custos e otimizar decisões. É a chave para se manter competitivo.
-                    
-                    ## Como implementar de forma prática
-                    1. **Defina KPIs claros**: Foque em métricas como conversão ou eficiência.
-                    2. **Teste com um MVP**: Implemente uma solução inicial para validar resultados.
-                    3. **Meça o impacto**: Use ROI = [(Ganho - Custo) / Custo] x 100.
-                    
-                    ## Exemplos de sucesso
-                    - Redução de 30% no tempo de processos com {fallback_topic}.
-                    - Aumento de 25% na conversão de vendas com automação.
-                    - Economia de R$ 200 mil/ano com otimização de recursos.
-                    
-                    ## Hora de agir
-                    {request.call_to_action} Vamos conversar sobre como {fallback_topic} pode transformar seu negócio? Nos vemos na próxima semana!
-                """),
-                "hashtags": ["#IA", "#CRM", "#CiênciaDeDados", "#Automação", "#Inovação"],
-                "status": "pending"
-            }
-            post_id = save_post_to_db(fallback_topic, post_data, request.session_id)
-            post = PostResponse(id=post_id, created_at=datetime.datetime.now().isoformat(), **post_data)
+            # Fallback em caso de falha após todas as tentativas ou com o circuito aberto
+            print(f"Falha na geração com o Team: {e}. Usando rascunho em cache ou post padrão.")
+            return degraded_post_data(request, cache_key, usage)
+
+def _generate_post_data_pipeline(request: GeneratePostRequest, usage: dict) -> tuple[str, dict]:
+    """
+    Modo pipeline: escolhe o tópico localmente (sem TopicAgent nem coordenação do Team) e
+    gera o post com uma única chamada estruturada ao PostWriter. O e-mail é enfileirado no finalize_post.
+    """
+    from src.agents import FALLBACK_TOPICS, MODEL_ID, POST_FORMAT_GUIDE
+    
+    if request.topic == DEFAULT_TOPIC:
+        topic = pick_fresh_topic() or database.least_used_topic() or FALLBACK_TOPICS[0]
+        request = request.model_copy(update={"topic": topic})
+    
+    prompt = POST_FORMAT_GUIDE.format(topic=request.topic, tone=request.tone, length=request.length, call_to_action=request.call_to_action)
+    cache_key = llm_cache.make_key(MODEL_ID, prompt)
+    post_data = cached_post_data(request, cache_key)
+    if post_data:
+        usage["cache_hit"] = True
+        return request.topic, post_data
+    
+    def run_writer():
+        # Cada chamada (inclusive a duplicada do hedging) usa um PostWriter livre, sem disputar o estado do agente
+        with checkout_post_writer() as writer, tracing.span("pipeline_run") as span:
+            response = writer.run(prompt, session_id=request.session_id)
+            tracing.record_run_metrics(response, span)
+            return response
+    
+    try:
+        response = gemini_caller.call(run_writer, hedge=run_writer)
+        draft = response.content
+        content = draft.model_dump_json() if isinstance(draft, PostDraft) else draft
+        if content:
+            post_data = parse_post_content(content)
+            llm_cache.set("posts", cache_key, MODEL_ID, content)
+        else:
+            post_data = build_fallback_post_data(request.topic, request.call_to_action)
+        return request.topic, post_data
+    
+    except Exception as e:
+        print(f"Falha na geração com o PostWriter: {e}. Usando rascunho em cache ou post padrão.")
+        return degraded_post_data(request, cache_key, usage)
+
+# --- Pós-processamento de um post já salvo ---
+def finalize_post(post: PostResponse, topic: str, session_id: str):
+    # Registra o título e o tópico no índice de quase-duplicatas
+    topic_index.add(post.title)
+    if topic != DEFAULT_TOPIC:
+        topic_index.add(topic)
+    
+    # Envia para aprovação com o id do post salvo (no fluxo do Team a ferramenta do ApprovalAgent só confirma)
+    outbox_sender.enqueue(post.id, post.title, post.content, post.hashtags, session_id, PUBLIC_BASE_URL)
+    print(f"E-mail de aprovação do post {post.id} enfileirado.")
+
+def save_generated_post(topic: str, post_data: dict, session_id: str) -> PostResponse:
+    post_id = database.save_post_to_db(topic, post_data, session_id)
+    post = PostResponse(id=post_id, created_at=datetime.datetime.now().isoformat(), **post_data)
+    finalize_post(post, topic, session_id)
+    return post
+
+# --- Geração síncrona do post (executada fora do event loop) ---
+def generate_post_sync(request: GeneratePostRequest) -> PostResponse:
+    post = claim_pooled_post(request)
+    if post:
+        return post
+    topic, post_data = generate_post_data(request)
+    return save_generated_post(topic, post_data, request.session_id)
+
+# --- Geração com streaming de eventos (executada fora do event loop) ---
+def stream_post_sync(request: GeneratePostRequest, emit) -> PostResponse:
+    """
+    Gera o post em modo streaming, chamando emit(evento, dados) a cada progresso.
+    Persiste o resultado pelo mesmo caminho de generate_post_sync.
+    """
+    if GENERATION_MODE == "pipeline":
+        # Uma única chamada estruturada: não há eventos intermediários do Team para repassar
+        emit("member_started", {"member": "PostWriter"})
+        topic, post_data = generate_post_data(request)
+        emit("topic", {"topic": topic})
+    else:
+        topic, post_data = stream_team_post_data(request, emit)
+    
+    return save_generated_post(topic, post_data, request.session_id)
+
+def stream_team_post_data(request: GeneratePostRequest, emit) -> tuple[str, dict]:
+    request = resolve_topic(request)
+    usage = {"model_calls": 0, "cache_hit": False, "fallback": False}
+    started = time.perf_counter()
+    with LLMCache.bypass(request.bypass_cache), count_calls() as calls, session_agents.session(request.session_id) as agents:
+        if request.topic != DEFAULT_TOPIC:
+            emit("topic", {"topic": request.topic})
+        sync_used_topics(agents, request.session_id)
+        content_team = agents.content_team
+        prompt, cache_key = build_generation_prompt(request, content_team)
+        post_data = cached_post_data(request, cache_key)
+        if post_data:
+            emit("cache_hit", {})
+            usage["cache_hit"] = True
+            remember_used_topic(agents, post_data["title"], request.session_id)
+            result = request.topic, post_data
+        else:
+            content = []
             
-            # Envia para aprovação
-            approval_result = send_post_for_approval.entrypoint(agent=approval_agent, post=post, session_id=request.session_id)
-            print(f"Resultado da aprovação: {approval_result}")
+            def run_stream():
+                try:
+                    with tracing.span("team_run", stream="true") as span:
+                        for chunk in content_team.run(prompt, session_id=request.session_id, stream=True, stream_intermediate_steps=True):
+                            event = getattr(chunk, "event", "")
+                            tool = getattr(chunk, "tool", None)
+                            if event == "TeamToolCallStarted" and tool and tool.tool_name == "transfer_task_to_member":
+                                emit("member_started", {"member": (tool.tool_args or {}).get("member_id")})
+                            elif event in ("TeamToolCallStarted", "ToolCallStarted") and tool:
+                                emit("tool_started", {"member": getattr(chunk, "agent_name", None), "tool": tool.tool_name})
+                            elif event == "RunStarted":
+                                emit("member_started", {"member": chunk.agent_name})
+                            elif event == "RunResponseContent" and isinstance(chunk.content, str):
+                                emit("member_delta", {"member": chunk.agent_name, "content": chunk.content})
+                            elif event == "RunCompleted" and request.topic == DEFAULT_TOPIC and chunk.agent_name == agents.topic_agent.name and isinstance(chunk.content, str):
+                                # Tópico escolhido pelo TopicAgent (o da requisição é só o marcador padrão)
+                                emit("topic", {"topic": chunk.content.strip()})
+                            elif event == "TeamRunResponseContent" and isinstance(chunk.content, str):
+                                content.append(chunk.content)
+                                emit("delta", {"content": chunk.content})
+                        tracing.record_run_metrics(content_team.run_response, span)
+                    return confirm_pending_approval(agents, content_team.run_response)
+                finally:
+                    # O contexto volta ao cache da sessão: os próximos runs não podem herdar o streaming
+                    agents.reset_streaming()
             
-            return post
+            try:
+                # Sem retry no streaming (parte do conteúdo já foi enviada ao cliente), mas respeita o circuit breaker
+                response = gemini_caller.call(run_stream, max_attempts=1)
+                
+                final_content = response.content if isinstance(response.content, str) and response.content else "".join(content)
+                if final_content:
+                    post_data = parse_post_content(final_content)
+                    llm_cache.set("posts", cache_key, content_team.model.id, final_content)
+                else:
+                    post_data = build_fallback_post_data(request.topic, request.call_to_action)
+                remember_used_topic(agents, post_data["title"], request.session_id)
+                result = request.topic, post_data
+            except Exception as e:
+                print(f"Falha na geração com streaming: {e}. Usando rascunho em cache ou post padrão.")
+                emit("fallback", {"detail": str(e)})
+                result = degraded_post_data(request, cache_key, usage)
+    usage["model_calls"] = calls.calls
+    generation_stats.record(GENERATION_MODE, time.perf_counter() - started, **usage)
+    return result
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# --- Fila de geração assíncrona com pool limitado de workers ---
+generation_queue = JobQueue(
+    worker=generate_post_sync,
+    max_workers=GENERATION_WORKERS,
+    max_pending=GENERATION_QUEUE_SIZE,
+)
+
+# --- Pool de rascunhos pré-gerados ---
+def produce_pooled_draft(profile: DraftPoolProfile) -> tuple[str, dict] | None:
+    """
+    Gera um rascunho para o pool pelo caminho do pipeline, mesmo com GENERATION_MODE=team:
+    o Team grava o tópico na sessão e o post só deve ir para aprovação na retirada.
+    Retorna None sem tópico livre ou quando a geração cai no fallback (o pool não guarda o post padrão).
+    """
+    topic = pick_fresh_topic()
+    if not topic:
+        return None
+    request = GeneratePostRequest(topic=topic, session_id="draft_pool", **profile.model_dump())
+    usage = {"model_calls": 0, "cache_hit": False, "fallback": False}
+    started = time.perf_counter()
+    with count_calls() as calls:
+        topic, post_data = _generate_post_data_pipeline(request, usage)
+    usage["model_calls"] = calls.calls
+    generation_stats.record("pool", time.perf_counter() - started, **usage)
+    return None if usage["fallback"] else (topic, post_data)
+
+draft_pool = DraftPool(
+    profiles=DRAFT_POOL_PROFILES,
+    size=DRAFT_POOL_SIZE,
+    produce=produce_pooled_draft,
+    retry_delay=DRAFT_POOL_RETRY_DELAY,
+) if DRAFT_POOL_SIZE > 0 else None
+if draft_pool:
+    draft_pool.register_metrics("linkedin_draft_pool")
+
+def claim_pooled_post(request: GeneratePostRequest) -> PostResponse | None:
+    """
+    Retira um rascunho pronto quando o pedido não fixa o tópico nem ignora o cache e o tom,
+    o tamanho e o CTA batem com um perfil do pool. Retorna None para seguir com a geração normal.
+    """
+    if not draft_pool or request.topic != DEFAULT_TOPIC or request.bypass_cache:
+        return None
+    profile = draft_pool.match(request.tone, request.length, request.call_to_action)
+    if not profile:
+        return None
+    draft = draft_pool.claim(profile, request.session_id)
+    if not draft:
+        return None
+    topic = draft.pop("topic")
+    post = PostResponse(**draft)
+    finalize_post(post, topic, request.session_id)
+    return post
+
+def job_to_response(job) -> JobResponse:
+    return JobResponse(job_id=job.id, status=job.status, result=job.result, error=job.error)
+
+# --- Rastreamento de cada requisição ---
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Abre um trace por requisição (reaproveitando o id recebido no cabeçalho, se houver),
+    devolve o id e o tempo por categoria (Server-Timing) e loga as requisições lentas.
+    O trace só termina depois do corpo da resposta, para medir também os endpoints em
+    streaming; nesses, o Server-Timing cobre só o tempo até o início do corpo.
+    """
+    trace_id = request.headers.get(TRACE_ID_HEADER) if TRACE_ID_HEADER else None
+    with tracing.start_trace(trace_id[:128] if trace_id else None) as trace:
+        with tracing.open_span("http_request", method=request.method) as (span, close_span):
+            response = await call_next(request)
+            route = request.scope.get("route")
+            span.labels["route"] = getattr(route, "path", "unmatched")
+    if TRACE_ID_HEADER:
+        breakdown = sorted(trace.breakdown().items(), key=lambda item: -item[1])
+        response.headers[TRACE_ID_HEADER] = trace.id
+        response.headers["Server-Timing"] = ", ".join(f"{category};dur={seconds * 1000:.1f}" for category, seconds in breakdown)
+    
+    body = response.body_iterator
+    
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            close_span()
+            if TRACE_SLOW_MS and span.duration * 1000 >= TRACE_SLOW_MS:
+                breakdown = sorted(trace.breakdown().items(), key=lambda item: -item[1])
+                details = ", ".join(f"{category} {seconds * 1000:.0f} ms" for category, seconds in breakdown)
+                print(f"Requisição lenta {request.method} {request.url.path} ({span.duration * 1000:.0f} ms, trace {trace.id}): {details}")
+    
+    response.body_iterator = traced_body()
+    return response
+
+# --- Endpoint para gerar post ---
+@app.post("/generate_post", response_model=PostResponse)
+async def generate_post(request: GeneratePostRequest):
+    # Executa o Team em uma thread para não bloquear o event loop
+    try:
+        return await run_in_threadpool(generate_post_sync, request)
+    except DuplicateTopicError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+# --- Endpoint para gerar post com streaming (Server-Sent Events) ---
+@app.post("/generate_post/stream")
+async def generate_post_stream(request: GeneratePostRequest):
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def emit(event: str | None, data: dict | None = None):
+        # Chamado pela thread de geração; entrega o evento ao event loop
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+    
+    def produce():
+        try:
+            post = stream_post_sync(request, emit)
+            emit("post", json.loads(post.model_dump_json()))
+        except Exception as e:
+            emit("error", {"detail": str(e)})
+        finally:
+            emit(None)
+    
+    async def events():
+        yield format_sse("started", {"session_id": request.session_id})
+        producer = asyncio.create_task(run_in_threadpool(produce))
+        while True:
+            event, data = await queue.get()
+            if event is None:
+                break
+            yield format_sse(event, data)
+        await producer
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Endpoint para enfileirar a geração de um post ---
+@app.post("/generate_post/async", response_model=JobResponse, status_code=202)
+async def generate_post_async(request: GeneratePostRequest):
+    try:
+        job = generation_queue.submit(request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job_to_response(job)
+
+# --- Endpoint para consultar o status de um job de geração ---
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    job = generation_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job com id {job_id} não encontrado.")
+    return job_to_response(job)
+
+def assign_batch_topics(requests: list[GeneratePostRequest]) -> list[GeneratePostRequest]:
+    """
+    Reserva um tópico diferente para cada item do lote sem tópico, para que os posts gerados
+    em paralelo não repitam o assunto. Sem tópico livre, o item fica com a escolha pelo LLM.
+    """
+    assigned = []
+    for request in requests:
+        topic = pick_fresh_topic() if request.topic == DEFAULT_TOPIC else None
+        assigned.append(request.model_copy(update={"topic": topic}) if topic else request)
+    return assigned
+
+# --- Endpoint para gerar posts em lote ---
+# Referências às gerações do lote em andamento: continuam (e salvam os posts) mesmo se o cliente desconectar
+batch_tasks: set[asyncio.Task] = set()
+
+def generate_batch_item(request: GeneratePostRequest) -> PostResponse:
+    topic, post_data = generate_post_data(request)
+    return save_generated_post(topic, post_data, request.session_id)
+
+@app.post("/generate_posts_batch")
+async def generate_posts_batch(batch: GeneratePostBatchRequest):
+    """
+    Gera vários posts em paralelo (limitados pelo gemini_limiter) e devolve NDJSON:
+    uma linha por post assim que ele é gerado e salvo. As gerações não dependem da resposta,
+    então os posts são salvos mesmo se o cliente desconectar.
+    """
+    size = len(batch.requests) or batch.count
+    if not size:
+        raise HTTPException(status_code=422, detail="Informe 'requests' ou um 'count' maior que zero.")
+    if size > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"O lote deve ter no máximo {MAX_BATCH_SIZE} posts.")
+    requests = await run_in_threadpool(assign_batch_topics, batch.requests or [batch.defaults] * batch.count)
+    
+    async def generate_one(index: int, request: GeneratePostRequest):
+        try:
+            return index, await run_in_threadpool(generate_batch_item, request), None
+        except Exception as e:
+            return index, None, str(e)
+    
+    tasks = [asyncio.create_task(generate_one(index, request)) for index, request in enumerate(requests)]
+    for task in tasks:
+        batch_tasks.add(task)
+        task.add_done_callback(batch_tasks.discard)
+    
+    async def stream():
+        for task in asyncio.as_completed(tasks):
+            index, post, error = await task
+            if error:
+                yield json.dumps({"index": index, "status": "failed", "error": error}, ensure_ascii=False) + "\n"
+            else:
+                yield json.dumps({"index": index, "status": "saved", "post": post.model_dump()}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- Endpoint de health check (não constrói agentes nem chama o LLM) ---
+@app.get("/health")
+async def health():
+    return {"status": "ok", "gemini_breaker": gemini_caller.breaker.state, "agent_sessions": session_agents.snapshot()}
 
 # --- Endpoint para consultar um post ---
 @app.get("/get_post/{post_id}", response_model=PostResponse)
 async def get_post(post_id: int):
-    conn = sqlite3.connect("tmp/linkedin.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, session_id, title, content, hashtags, status, rejection_reason, created_at FROM posts WHERE id = ?",
-        (post_id,)
-    )
-    post = cursor.fetchone()
-    conn.close()
-    
+    post = await run_in_threadpool(database.fetch_post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail=f"Post com id {post_id} não encontrado.")
-    
-    return PostResponse(
-        id=post[0],
-        title=post[2],
-        content=post[3],
-        hashtags=eval(post[4]),
-        status=post[5],
-        rejection_reason=post[6],
-        created_at=post[7]
-    )
+    return PostResponse(**post)
+
+# --- Endpoint para listar posts (paginação por cursor) ---
+@app.get("/posts", response_model=PostListResponse)
+async def list_posts(
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: str | None = None,
+    status: str | None = None,
+    session_id: str | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+):
+    """
+    Lista os posts dos mais recentes para os mais antigos. Para a próxima página, repita a
+    consulta com os mesmos filtros e o next_cursor da resposta.
+    """
+    try:
+        posts, next_cursor = await run_in_threadpool(
+            database.list_posts, limit, cursor, status, session_id, start_date, end_date
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return PostListResponse(posts=posts, next_cursor=next_cursor)
+
+# --- Endpoint para exportar posts (NDJSON ou CSV em streaming) ---
+EXPORT_CSV_COLUMNS = ["id", "session_id", "topic", "title", "content", "hashtags", "status", "rejection_reason", "created_at"]
+
+def export_ndjson(batches):
+    for batch in batches:
+        yield b"".join(orjson.dumps(post) + b"\n" for post in batch)
+
+def export_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows({**post, "hashtags": " ".join(post["hashtags"])} for post in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+@app.get("/posts/export")
+async def export_posts(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    status: str | None = None,
+    session_id: str | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+):
+    """
+    Exporta todos os posts filtrados lendo o cursor do SQLite em lotes enquanto a resposta é
+    enviada, sem montar o resultado em memória.
+    """
+    batches = database.iter_posts(status=status, session_id=session_id, start_date=start_date, end_date=end_date)
+    if format == "csv":
+        return StreamingResponse(export_csv(batches), media_type="text/csv; charset=utf-8",
+                                 headers={"Content-Disposition": 'attachment; filename="posts.csv"'})
+    return StreamingResponse(export_ndjson(batches), media_type="application/x-ndjson")
 
 # --- Endpoint para aprovar post ---
 @app.get("/approve_post/{post_id}")
 async def approve_post(post_id: int):
-    conn = sqlite3.connect("tmp/linkedin.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE posts SET status = 'approved' WHERE id = ?", (post_id,))
-    if cursor.rowcount == 0:
-        conn.close()
+    if not await run_in_threadpool(database.update_post_status, post_id, "approved"):
         raise HTTPException(status_code=404, detail=f"Post com id {post_id} não encontrado.")
-    conn.commit()
-    conn.close()
     return {"message": f"Post {post_id} aprovado com sucesso!"}
 
 # --- Endpoint para rejeitar post ---
 @app.get("/reject_post/{post_id}")
 async def reject_post(post_id: int, reason: str = "Nenhum motivo fornecido"):
-    conn = sqlite3.connect("tmp/linkedin.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE posts SET status = 'rejected', rejection_reason = ? WHERE id = ?", (reason, post_id))
-    if cursor.rowcount == 0:
-        conn.close()
+    if not await run_in_threadpool(database.update_post_status, post_id, "rejected", reason):
         raise HTTPException(status_code=404, detail=f"Post com id {post_id} não encontrado.")
-    conn.commit()
-    conn.close()
     return {"message": f"Post {post_id} rejeitado. Motivo: {reason}"}
 
+# --- Endpoint para aprovar e rejeitar posts em lote ---
+@app.post("/posts/moderate", response_model=ModeratePostsResponse)
+async def moderate_posts(batch: ModeratePostsRequest):
+    """
+    Aprova ou rejeita vários posts em uma única transação, atualizando os contadores de
+    métricas e de motivos de rejeição no mesmo commit. Ids inexistentes não interrompem o
+    lote: aparecem como 'not_found' nos resultados.
+    """
+    if len(batch.actions) > MAX_MODERATION_BATCH:
+        raise HTTPException(status_code=422, detail=f"O lote deve ter no máximo {MAX_MODERATION_BATCH} ações.")
+    statuses = {"approve": "approved", "reject": "rejected"}
+    changes = [
+        (action.id, statuses[action.action], action.reason if action.action == "reject" else None)
+        for action in batch.actions
+    ]
+    found = await run_in_threadpool(database.update_posts_status, changes)
+    results = [
+        ModerationResult(id=post_id, status=status if exists else "not_found")
+        for (post_id, status, _), exists in zip(changes, found)
+    ]
+    counts = {status: sum(1 for result in results if result.status == status) for status in ("approved", "rejected", "not_found")}
+    return ModeratePostsResponse(results=results, **counts)
+
 # --- Endpoint para métricas ---
 @app.get("/metrics", response_model=MetricsResponse)
-async def get_metrics():
-    conn = sqlite3.connect("tmp/linkedin.db")
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT strftime('%W', created_at) as week, COUNT(*) 
-        FROM posts 
-        GROUP BY strftime('%W', created_at)
-    """)
-    posts_per_week = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    cursor.execute("SELECT topic, usage_count FROM topics ORDER BY usage_count DESC LIMIT 5")
-    popular_topics = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
-    return MetricsResponse(posts_per_week=posts_per_week, popular_topics=popular_topics)
\ No newline at end of file
+async def get_metrics(start_date: datetime.date | None = None, end_date: datetime.date | None = None, status: str | None = None):
+    # Lê apenas os contadores pré-computados, mantidos a cada escrita em posts
+    metrics = await run_in_threadpool(database.fetch_metrics, start_date=start_date, end_date=end_date, status=status)
+    popular_topics = await run_in_threadpool(database.fetch_popular_topics)
+    return MetricsResponse(popular_topics=popular_topics, generation_modes=generation_stats.snapshot(), **metrics)
+
+# --- Endpoint para o estado do pool de rascunhos ---
+@app.get("/pool/stats")
+async def get_pool_stats():
+    if not draft_pool:
+        return {"enabled": False}
+    return {"enabled": True, **await run_in_threadpool(draft_pool.snapshot)}
+
+# --- Endpoint para estatísticas do cache do LLM ---
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return await run_in_threadpool(llm_cache.stats)
+
+# --- Endpoint de instrumentação por etapa (formato do Prometheus) ---
+@app.get("/internal/stats", response_class=PlainTextResponse)
+async def internal_stats():
+    return PlainTextResponse(tracing.stats.render(), media_type="text/plain; version=0.0.4")
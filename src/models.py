@@ -0,0 +1,91 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+# --- Modelos Pydantic ---
+# Tópico genérico: quando usado, o TopicAgent escolhe o tópico
+DEFAULT_TOPIC = "Um tópico relevante sobre Ciência de Dados, CRM ou IA."
+
+class GeneratePostRequest(BaseModel):
+    topic: str = DEFAULT_TOPIC
+    tone: str = "profissional e direto"
+    length: int = 1500  # Atualizado para refletir o tamanho do post exemplo
+    call_to_action: str = "O que você acha? Compartilhe sua opinião!"
+    session_id: str = "default_session"
+    bypass_cache: bool = False
+    on_duplicate: Literal["reroll", "reject", "allow"] = Field(default="reroll", description="O que fazer se o tópico for quase-duplicata de um post anterior.")
+
+class PostResponse(BaseModel):
+    id: int
+    title: str
+    content: str
+    hashtags: list[str]
+    status: str = "pending"
+    rejection_reason: str | None = None
+    created_at: str
+
+class PostRecord(PostResponse):
+    # Post completo da listagem e da exportação
+    session_id: str | None = None
+    topic: str | None = None
+
+class PostListResponse(BaseModel):
+    posts: list[PostRecord]
+    next_cursor: str | None = None  # Passe em ?cursor= para a próxima página; None na última
+
+class PostDraft(BaseModel):
+    # Saída estruturada do PostWriter no modo pipeline (id, status e datas são do banco)
+    title: str
+    content: str
+    hashtags: list[str]
+
+class DraftPoolProfile(BaseModel):
+    # Combinação de tom, tamanho e CTA para a qual o pool mantém rascunhos prontos
+    tone: str = GeneratePostRequest.model_fields["tone"].default
+    length: int = GeneratePostRequest.model_fields["length"].default
+    call_to_action: str = GeneratePostRequest.model_fields["call_to_action"].default
+
+    @property
+    def key(self) -> str:
+        return f"{self.tone}|{self.length}|{self.call_to_action}"
+
+class GeneratePostBatchRequest(BaseModel):
+    requests: list[GeneratePostRequest] = []
+    count: int = Field(default=0, ge=0, description="Quantidade de posts a gerar com os valores de 'defaults' (ignorado se 'requests' for informado).")
+    defaults: GeneratePostRequest = GeneratePostRequest()
+
+class ModerationAction(BaseModel):
+    id: int
+    action: Literal["approve", "reject"]
+    reason: str = "Nenhum motivo fornecido"  # Usado só em 'reject'
+
+class ModeratePostsRequest(BaseModel):
+    actions: list[ModerationAction] = Field(min_length=1, description="Aplicadas em ordem, em uma única transação.")
+
+class ModerationResult(BaseModel):
+    id: int
+    status: Literal["approved", "rejected", "not_found"]
+
+class ModeratePostsResponse(BaseModel):
+    results: list[ModerationResult]  # Na mesma ordem de 'actions'
+    approved: int = 0
+    rejected: int = 0
+    not_found: int = 0
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    result: PostResponse | None = None
+    error: str | None = None
+
+class MetricsResponse(BaseModel):
+    posts_per_week: dict  # Chave no formato de semana ISO 'AAAA-Wss'
+    popular_topics: list
+    posts_per_status: dict = {}
+    posts_per_session: dict = {}
+    posts_per_topic: dict = {}
+    approval_rate: float | None = None
+    rejection_rate: float | None = None
+    rejection_reasons: dict = {}
+    generation_modes: dict = {}  # Latência e chamadas ao modelo por modo de geração (team/pipeline/pool)
+    status: str = "success"
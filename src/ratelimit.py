@@ -0,0 +1,130 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+from src import tracing
+
+# Chamado quando o limitador libera uma chamada na thread atual (usado pelo hedging para
+# medir a latência sem contar a espera na fila do limitador)
+_on_acquire = contextvars.ContextVar("on_acquire", default=None)
+
+
+@contextlib.contextmanager
+def on_acquire(callback):
+    token = _on_acquire.set(callback)
+    try:
+        yield
+    finally:
+        _on_acquire.reset(token)
+
+
+# Contador das requisições ao modelo feitas no contexto atual (ver count_calls)
+_call_counter = contextvars.ContextVar("call_counter", default=None)
+
+
+class CallCounter:
+    """
+    Requisições ao modelo feitas dentro de count_calls, inclusive as que falharam, as dos
+    membros do Team, as das ferramentas e as das threads do hedging (que copiam o contexto).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.calls += 1
+
+
+@contextlib.contextmanager
+def count_calls():
+    counter = CallCounter()
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+def _count_call():
+    counter = _call_counter.get()
+    if counter:
+        counter.add()
+
+
+class GeminiRateLimiter:
+    """
+    Limita as chamadas ao Gemini com um token bucket (requisições por minuto)
+    e um semáforo de chamadas simultâneas. É thread-safe, pois as gerações
+    rodam nas threads dos workers e do threadpool do FastAPI.
+
+    É aplicado no nível do modelo (ver RateLimitedModel): cada requisição ao Gemini,
+    inclusive as dos membros do Team e das ferramentas, consome um token.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, max_concurrent: int = 8, burst: int | None = None):
+        self.rate = requests_per_minute / 60.0  # tokens por segundo
+        self.capacity = burst or max_concurrent
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire_token(self):
+        # Bloqueia até existir um token disponível no bucket
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def __enter__(self):
+        # Tempo na fila do limitador, separado do tempo da chamada ao Gemini
+        with tracing.span("rate_limit_wait"):
+            self._semaphore.acquire()
+            try:
+                self.acquire_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        callback = _on_acquire.get()
+        if callback:
+            callback()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
+
+    def __deepcopy__(self, memo):
+        # Cópias de modelos e agentes feitas pelo agno continuam sob o mesmo limite
+        return self
+
+
+class RateLimitedModel:
+    """
+    Mixin para modelos do agno (ex.: `class LimitedGemini(RateLimitedModel, Gemini)`):
+    invoke e invoke_stream passam pelo `limiter` da instância e são contadas no count_calls
+    ativo. O agno chama esses métodos uma vez por requisição ao provedor e libera o modelo antes
+    de executar as ferramentas, então o slot não fica preso durante as chamadas aninhadas dos
+    membros do Team.
+    """
+
+    limiter: GeminiRateLimiter | None = None
+
+    def invoke(self, *args, **kwargs):
+        _count_call()
+        with self.limiter or contextlib.nullcontext():
+            return super().invoke(*args, **kwargs)
+
+    def invoke_stream(self, *args, **kwargs):
+        _count_call()
+        with self.limiter or contextlib.nullcontext():
+            yield from super().invoke_stream(*args, **kwargs)
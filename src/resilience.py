@@ -0,0 +1,278 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+from src import tracing
+from src.ratelimit import on_acquire
+
+# Classes de erro: as três primeiras indicam indisponibilidade do Gemini e são repetidas
+RATE_LIMITED = "rate_limited"
+UNAVAILABLE = "unavailable"
+TIMEOUT = "timeout"
+FATAL = "fatal"
+RETRYABLE = (RATE_LIMITED, UNAVAILABLE, TIMEOUT)
+
+
+class CircuitOpenError(Exception):
+    """
+    Levantada sem chamar o Gemini enquanto o circuit breaker está aberto.
+    """
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classifica a exceção (e as causas encadeadas) pelo status HTTP do agno/google-genai,
+    pelo tipo (timeouts) ou, em último caso, pelo texto da mensagem.
+    """
+    current = error
+    while current is not None:
+        if isinstance(current, TimeoutError) or "Timeout" in type(current).__name__:
+            return TIMEOUT
+        status = getattr(current, "status_code", None) or getattr(current, "code", None)
+        if status == 429:
+            return RATE_LIMITED
+        if status in (500, 502, 503, 504):
+            return UNAVAILABLE
+        current = current.__cause__
+    message = str(error).upper()
+    if "429" in message or "RESOURCE_EXHAUSTED" in message:
+        return RATE_LIMITED
+    if "DEADLINE_EXCEEDED" in message or "TIMED OUT" in message:
+        return TIMEOUT
+    if "503" in message or "UNAVAILABLE" in message or "OVERLOADED" in message:
+        return UNAVAILABLE
+    return FATAL
+
+
+class RetryPolicy:
+    """
+    Backoff exponencial com jitter completo: a espera da tentativa n é sorteada entre 0 e
+    min(max_delay, base_delay * 2^n). Erros 429 começam com o dobro da espera.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, kind: str) -> float:
+        base = self.base_delay * (2 if kind == RATE_LIMITED else 1)
+        return random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas de indisponibilidade seguidas; aberto, recusa as
+    chamadas por `recovery_timeout` segundos e depois deixa passar uma chamada de teste
+    (half-open), que fecha o circuito se tiver sucesso ou o reabre se falhar.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_running:
+                self._probe_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("Circuit breaker do Gemini fechado.")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_running = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                print(f"Circuit breaker do Gemini aberto após {self.failures} falhas seguidas.")
+
+    def release(self):
+        # A chamada de teste terminou com erro não relacionado à disponibilidade
+        with self._lock:
+            self._probe_running = False
+
+
+class Hedger:
+    """
+    Dispara uma segunda chamada quando a primeira passa do percentil `percentile` das
+    latências recentes e devolve a que terminar primeiro com sucesso. Só deve ser usado
+    em chamadas idempotentes (sem e-mail, sem escrita em storage).
+
+    A latência é medida a partir da liberação pelo limitador de chamadas (aplicado no
+    modelo), para que a espera na fila do limitador não dispare hedges.
+    """
+
+    def __init__(self, percentile: float, min_samples: int = 20, window: int = 200, max_workers: int = 16):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.fired = 0
+        self.won = 0
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-hedge")
+
+    def threshold(self) -> float | None:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def call(self, primary: Callable[[], Any], secondary: Callable[[], Any]) -> Any:
+        threshold = self.threshold()
+        if threshold is None:
+            return self._measured(primary)
+        started = threading.Event()
+        first = self._executor.submit(contextvars.copy_context().run, self._measured, primary, started)
+        # O prazo do hedge só começa a contar quando a primeira chamada passa pelo limitador
+        while not started.wait(0.05):
+            if first.done():
+                return first.result()
+        done, _ = wait([first], timeout=threshold)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.fired += 1
+        second = self._executor.submit(contextvars.copy_context().run, self._measured, secondary)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            # A primeira a terminar falhou: espera a outra
+            winner = pending.pop()
+            winner.exception()
+        if winner is second and winner.exception() is None:
+            with self._lock:
+                self.won += 1
+        return winner.result()
+
+    def _measured(self, fn: Callable[[], Any], started: threading.Event | None = None) -> Any:
+        began = time.perf_counter()
+
+        def acquired():
+            # Só a primeira liberação conta: as demais chamadas do run fazem parte da latência
+            nonlocal began
+            if started is None or not started.is_set():
+                began = time.perf_counter()
+                if started is not None:
+                    started.set()
+
+        with on_acquire(acquired):
+            result = fn()
+        with self._lock:
+            self._latencies.append(time.perf_counter() - began)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ResilientCaller:
+    """
+    Executa chamadas ao Gemini com retry classificado, circuit breaker compartilhado e,
+    opcionalmente, hedging. O limite de chamadas é aplicado no modelo (RateLimitedModel).
+    Roda nas threads de geração, então as esperas do backoff nunca bloqueiam o event loop.
+    """
+
+    def __init__(self, policy: RetryPolicy, breaker: CircuitBreaker, hedger: Hedger | None = None):
+        self.policy = policy
+        self.breaker = breaker
+        self.hedger = hedger
+        self.retries: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[[], Any], hedge: Callable[[], Any] | None = None, max_attempts: int | None = None) -> Any:
+        """
+        Chama fn() até max_attempts vezes. `hedge` (opcional) é a versão idempotente usada
+        na chamada duplicada do hedging. Levanta CircuitOpenError se o circuito estiver aberto.
+        """
+        max_attempts = max_attempts or self.policy.max_attempts
+        for attempt in range(max_attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Circuit breaker do Gemini aberto; chamada não realizada.")
+            try:
+                if self.hedger and hedge:
+                    result = self.hedger.call(fn, hedge)
+                else:
+                    result = fn()
+            except Exception as e:
+                kind = classify_error(e)
+                self._count(self.errors, kind)
+                print(f"Tentativa {attempt + 1}/{max_attempts} falhou ({kind}): {str(e)}")
+                if kind not in RETRYABLE:
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if attempt == max_attempts - 1:
+                    raise
+                self._count(self.retries, kind)
+                with tracing.span("retry_backoff", kind=kind):
+                    time.sleep(self.policy.delay(attempt, kind))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retries, errors = dict(self.retries), dict(self.errors)
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_consecutive_failures": self.breaker.failures,
+            "breaker_times_opened": self.breaker.times_opened,
+            "breaker_rejected": self.breaker.rejected,
+            "retries": retries,
+            "errors": errors,
+            "hedges_fired": self.hedger.fired if self.hedger else 0,
+            "hedges_won": self.hedger.won if self.hedger else 0,
+        }
+
+    def register_metrics(self, prefix: str, stats: tracing.StageStats = tracing.stats):
+        """
+        Expõe o estado do breaker, retries, erros e hedges no /internal/stats.
+        """
+        states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        stats.register(f"{prefix}_breaker_state", "gauge", "Estado do circuit breaker (0 fechado, 1 half-open, 2 aberto).",
+                       lambda: [({}, states[self.breaker.state])])
+        stats.register(f"{prefix}_breaker_opened_total", "counter", "Vezes que o circuit breaker abriu.",
+                       lambda: [({}, self.breaker.times_opened)])
+        stats.register(f"{prefix}_breaker_rejected_total", "counter", "Chamadas recusadas com o circuito aberto.",
+                       lambda: [({}, self.breaker.rejected)])
+        stats.register(f"{prefix}_errors_total", "counter", "Erros das chamadas por classe.",
+                       lambda: [({"kind": kind}, value) for kind, value in sorted(self.snapshot()["errors"].items())])
+        stats.register(f"{prefix}_retries_total", "counter", "Novas tentativas por classe de erro.",
+                       lambda: [({"kind": kind}, value) for kind, value in sorted(self.snapshot()["retries"].items())])
+        stats.register(f"{prefix}_hedges_total", "counter", "Chamadas duplicadas pelo hedging (fired) e quantas venceram (won).",
+                       lambda: [({"result": "fired"}, self.hedger.fired if self.hedger else 0), ({"result": "won"}, self.hedger.won if self.hedger else 0)])
+
+    def _count(self, counters: dict[str, int], kind: str):
+        with self._lock:
+            counters[kind] = counters.get(kind, 0) + 1
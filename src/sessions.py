@@ -0,0 +1,143 @@
+import contextlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from src import tracing
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()  # Protege só o estado compartilhado pelos contextos da sessão
+        self.state: dict = {}
+        self.idle: list = []  # Contextos construídos e livres
+        self.sizes: dict[int, int] = {}  # Memória estimada de cada contexto construído, por id
+        self.users = 0  # Pedidos usando a sessão; só entradas com 0 são descartadas
+
+    @property
+    def size(self) -> int:
+        return sum(self.sizes.values())
+
+
+class SessionCache:
+    """
+    LRU dos contextos de execução por session_id (agentes e Team próprios, construídos por
+    `build(session_id)`). Cada pedido usa um contexto só seu: pedidos simultâneos da mesma
+    sessão recebem contextos diferentes (até `max_idle` deles ficam guardados para reuso), e
+    só o estado compartilhado da sessão (ver shared_state) é acessado em fila. O cache é
+    limitado pelo número de sessões e pela memória estimada por `size_of`; descartar uma
+    sessão ociosa não perde estado, que já está gravado no SQLite, e ela é reconstruída a
+    partir dele no próximo pedido.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str], Any],
+        max_sessions: int = 100,
+        max_bytes: int = 64 * 1024 * 1024,
+        size_of: Callable[[Any], int] = lambda agents: 0,
+        max_idle: int = 4,
+    ):
+        self.build = build
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.max_idle = max_idle
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self, session_id: str):
+        """
+        Reserva um contexto livre da sessão (construindo um novo se não houver) enquanto o bloco roda.
+        """
+        entry, agents = self._checkout(session_id)
+        try:
+            if agents is None:
+                with tracing.span("session_build"):
+                    agents = self.build(session_id)
+            yield agents
+        finally:
+            self._checkin(entry, agents)
+
+    @contextlib.contextmanager
+    def shared_state(self, session_id: str):
+        """
+        Estado compartilhado pelos contextos da sessão (ex.: os tópicos já usados), acessado com
+        o lock da sessão. Só deve ser usado dentro de um bloco session() da mesma sessão.
+        """
+        with self._lock:
+            entry = self._entries[session_id]
+        with entry.lock:
+            yield entry.state
+
+    def _checkout(self, session_id: str) -> tuple[_Entry, Any]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = self._entries[session_id] = _Entry()
+            if entry.idle:
+                self.hits += 1
+                agents = entry.idle.pop()
+            else:
+                self.misses += 1
+                agents = None
+            self._entries.move_to_end(session_id)
+            entry.users += 1
+            return entry, agents
+
+    def _checkin(self, entry: _Entry, agents: Any):
+        size = self.size_of(agents) if agents is not None else 0
+        with self._lock:
+            entry.users -= 1
+            if agents is not None:
+                if len(entry.idle) < self.max_idle:
+                    entry.idle.append(agents)
+                    entry.sizes[id(agents)] = size
+                else:
+                    entry.sizes.pop(id(agents), None)
+            self._evict()
+
+    def _evict(self):
+        # Descarta as sessões ociosas menos usadas até voltar aos limites (as em uso ficam, mesmo acima deles)
+        total = sum(entry.size for entry in self._entries.values())
+        for session_id, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_sessions and total <= self.max_bytes:
+                break
+            if entry.users:
+                continue
+            del self._entries[session_id]
+            total -= entry.size
+            self.evictions += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "in_use": sum(1 for entry in self._entries.values() if entry.users),
+                "contexts": sum(len(entry.idle) + entry.users for entry in self._entries.values()),
+                "estimated_bytes": sum(entry.size for entry in self._entries.values()),
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def register_metrics(self, prefix: str, stats: tracing.StageStats = tracing.stats):
+        """
+        Expõe o tamanho do cache, os acertos e os descartes no /internal/stats.
+        """
+        stats.register(f"{prefix}_sessions", "gauge", "Sessões com agentes em memória.",
+                       lambda: [({}, self.snapshot()["sessions"])])
+        stats.register(f"{prefix}_contexts", "gauge", "Contextos (agentes e Team) em memória, livres ou em uso.",
+                       lambda: [({}, self.snapshot()["contexts"])])
+        stats.register(f"{prefix}_estimated_bytes", "gauge", "Memória estimada das sessões em cache.",
+                       lambda: [({}, self.snapshot()["estimated_bytes"])])
+        stats.register(f"{prefix}_lookups_total", "counter", "Pedidos com um contexto livre da sessão em memória (hit) ou construído do SQLite (miss).",
+                       lambda: [({"result": "hit"}, self.hits), ({"result": "miss"}, self.misses)])
+        stats.register(f"{prefix}_evictions_total", "counter", "Sessões descartadas pelos limites do cache.",
+                       lambda: [({}, self.evictions)])
@@ -0,0 +1,160 @@
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Callable, Iterable
+
+import numpy as np
+
+
+def normalize(text: str) -> str:
+    """
+    Minúsculas, sem acentos e sem pontuação, com espaços colapsados.
+    """
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text)).strip()
+
+
+def shingles(normalized: str, size: int = 4) -> set[str]:
+    text = normalized
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class SimilarityIndex:
+    """
+    Índice de quase-duplicatas com MinHash + LSH sobre shingles de caracteres.
+
+    - `find_duplicate` usa as bandas do LSH: só compara com candidatos que
+      colidem em alguma banda, então o custo não cresce com o tamanho do índice.
+    - `most_similar` compara a assinatura com a matriz de todas as assinaturas
+      de forma vetorizada (NumPy), para montar um top-k limitado para os prompts.
+
+    O conteúdo é carregado na primeira consulta por `loader` e atualizado com `add`.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Iterable[str]] | None = None,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 4,
+        threshold: float = 0.5,
+        seed: int = 42,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands.")
+        self.loader = loader
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Hash multiply-shift: a ímpar de 64 bits, b de 64 bits
+        self._a = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+        self._texts: list[str] = []
+        self._keys: dict[str, int] = {}
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._buckets: dict[tuple[int, bytes], list[int]] = {}
+        self._loaded = loader is None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._texts)
+
+    def _shingle_hashes(self, normalized: str) -> list[int]:
+        hashes = [zlib.crc32(shingle.encode("ascii")) for shingle in shingles(normalized, self.shingle_size)]
+        return hashes or [0]
+
+    def _minhash(self, hashes: np.ndarray) -> np.ndarray:
+        # (a * x + b) mod 2^64 (overflow natural do uint64), mantendo os 32 bits mais altos
+        return (self._a * hashes + self._b) >> np.uint64(32)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(self._shingle_hashes(normalize(text)), dtype=np.uint64)
+        return self._minhash(hashes).min(axis=1).astype(np.uint32)
+
+    def signatures(self, normalized_texts: list[str], chunk_size: int = 1000) -> np.ndarray:
+        """
+        Calcula as assinaturas de vários textos já normalizados de uma vez (usado na carga inicial do índice).
+        """
+        result = np.empty((len(normalized_texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(normalized_texts), chunk_size):
+            per_text = [self._shingle_hashes(text) for text in normalized_texts[start:start + chunk_size]]
+            offsets = np.cumsum([0] + [len(hashes) for hashes in per_text[:-1]])
+            hashes = np.fromiter((h for text_hashes in per_text for h in text_hashes), dtype=np.uint64)
+            minhashes = np.minimum.reduceat(self._minhash(hashes), offsets, axis=1)
+            result[start:start + len(per_text)] = minhashes.T
+        return result
+
+    def add(self, text: str):
+        if not text or not text.strip():
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._add(text, normalize(text), self.signature(text))
+
+    def find_duplicate(self, text: str) -> tuple[str, float] | None:
+        """
+        Retorna (texto existente, similaridade estimada) se houver uma quase-duplicata, senão None.
+        """
+        signature = self.signature(text)
+        with self._lock:
+            self._ensure_loaded()
+            candidates = set()
+            for band, key in self._band_keys(signature):
+                candidates.update(self._buckets.get((band, key), ()))
+            if not candidates:
+                return None
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            scores = (self._signatures[candidates] == signature).mean(axis=1)
+            best = int(scores.argmax())
+            if scores[best] >= self.threshold:
+                return self._texts[candidates[best]], float(scores[best])
+        return None
+
+    def most_similar(self, text: str, k: int = 10) -> list[tuple[str, float]]:
+        signature = self.signature(text)
+        with self._lock:
+            self._ensure_loaded()
+            if not self._texts:
+                return []
+            scores = (self._signatures[:len(self._texts)] == signature).mean(axis=1)
+            top = np.argsort(-scores, kind="stable")[:k]
+            return [(self._texts[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            texts = [text for text in self.loader() if text and text.strip()]
+            normalized = [normalize(text) for text in texts]
+            for text, key, signature in zip(texts, normalized, self.signatures(normalized)):
+                self._add(text, key, signature)
+            self._loaded = True
+
+    def _add(self, text: str, key: str, signature: np.ndarray):
+        if key in self._keys:
+            return
+        index = len(self._texts)
+        if index == len(self._signatures):
+            # Cresce a matriz de assinaturas em blocos para manter o append amortizado
+            grown = np.empty((max(64, 2 * len(self._signatures)), self.num_perm), dtype=np.uint32)
+            grown[:index] = self._signatures[:index]
+            self._signatures = grown
+        self._signatures[index] = signature
+        self._texts.append(text)
+        self._keys[key] = index
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(index)
+
+    def _band_keys(self, signature: np.ndarray):
+        raw = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [(band, raw[band * width:(band + 1) * width]) for band in range(self.bands)]
@@ -0,0 +1,280 @@
+import contextlib
+import contextvars
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable
+
+# Trace da requisição atual e span aberto mais interno. Propagam para as threads do
+# run_in_threadpool (que copia o contexto) e para os jobs da JobQueue.
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+# Limites dos buckets dos histogramas, em segundos
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Categoria de cada etapa para atribuir o tempo de uma requisição lenta (Gemini, SQLite ou SMTP)
+CATEGORIES = {
+    "team_run": "gemini",
+    "member_run": "gemini",
+    "pipeline_run": "gemini",
+    "continue_run": "gemini",
+    "model_call": "gemini",
+    "db_write": "sqlite",
+    "db_lock_wait": "sqlite",
+    "smtp_connect": "smtp",
+    "smtp_send": "smtp",
+    "cache_lookup": "cache",
+}
+
+
+@dataclass
+class Span:
+    stage: str
+    labels: dict
+    start: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    children: float = 0.0  # Tempo dos spans filhos, para calcular o tempo próprio
+    attributes: dict = field(default_factory=dict)
+    error: bool = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def self_time(self) -> float:
+        return max(0.0, self.duration - self.children)
+
+
+class Trace:
+    """
+    Spans de uma requisição, para o detalhamento por categoria e o log de requisições lentas.
+    """
+
+    def __init__(self, trace_id: str | None = None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def breakdown(self) -> dict[str, float]:
+        """
+        Tempo próprio (sem os filhos) somado por categoria, em segundos.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        totals: dict[str, float] = {}
+        for span in spans:
+            category = CATEGORIES.get(span.stage, "app")
+            totals[category] = totals.get(category, 0.0) + span.self_time
+        return totals
+
+
+class StageStats:
+    """
+    Histogramas de duração e contadores de tokens, acertos de cache e erros por etapa,
+    agregados de todos os spans e exportados no formato do Prometheus.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple, list] = {}  # chave -> [contagens por bucket, soma, total]
+        self._tokens: dict[tuple, int] = {}
+        self._cache: dict[tuple, int] = {}
+        self._errors: dict[tuple, int] = {}
+        self._collectors: list[tuple[str, str, str, Callable[[], list[tuple[dict, float]]]]] = []
+
+    def register(self, name: str, kind: str, help_text: str, collect: Callable[[], list[tuple[dict, float]]]):
+        """
+        Registra uma métrica lida no momento da exportação (ex.: estado do circuit breaker).
+        `collect` devolve pares (labels, valor).
+        """
+        self._collectors.append((name, kind, help_text, collect))
+
+    def observe(self, span: Span):
+        key = (span.stage, tuple(sorted(span.labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += span.duration
+            histogram[2] += 1
+            for direction in ("input", "output"):
+                tokens = span.attributes.get(f"{direction}_tokens")
+                if tokens:
+                    token_key = key + (direction,)
+                    self._tokens[token_key] = self._tokens.get(token_key, 0) + int(tokens)
+            if "cache_hit" in span.attributes:
+                cache_key = key + ("hit" if span.attributes["cache_hit"] else "miss",)
+                self._cache[cache_key] = self._cache.get(cache_key, 0) + 1
+            if span.error:
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = {key: (list(counts), total, count) for key, (counts, total, count) in self._histograms.items()}
+            tokens, cache, errors = dict(self._tokens), dict(self._cache), dict(self._errors)
+
+        lines = [
+            "# HELP linkedin_stage_duration_seconds Duração de cada etapa do processamento das requisições.",
+            "# TYPE linkedin_stage_duration_seconds histogram",
+        ]
+        for (stage, labels), (counts, total, count) in sorted(histograms.items()):
+            base = {"stage": stage, **dict(labels)}
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"linkedin_stage_duration_seconds_bucket{_labels({**base, 'le': repr(bound)})} {bucket_count}")
+            lines.append(f"linkedin_stage_duration_seconds_bucket{_labels({**base, 'le': '+Inf'})} {count}")
+            lines.append(f"linkedin_stage_duration_seconds_sum{_labels(base)} {total:.6f}")
+            lines.append(f"linkedin_stage_duration_seconds_count{_labels(base)} {count}")
+
+        lines += [
+            "# HELP linkedin_stage_tokens_total Tokens consumidos por etapa.",
+            "# TYPE linkedin_stage_tokens_total counter",
+        ]
+        for (stage, labels, direction), value in sorted(tokens.items()):
+            lines.append(f"linkedin_stage_tokens_total{_labels({'stage': stage, **dict(labels), 'direction': direction})} {value}")
+
+        lines += [
+            "# HELP linkedin_stage_cache_lookups_total Consultas ao cache do LLM por etapa e resultado.",
+            "# TYPE linkedin_stage_cache_lookups_total counter",
+        ]
+        for (stage, labels, result), value in sorted(cache.items()):
+            lines.append(f"linkedin_stage_cache_lookups_total{_labels({'stage': stage, **dict(labels), 'result': result})} {value}")
+
+        lines += [
+            "# HELP linkedin_stage_errors_total Etapas encerradas com exceção.",
+            "# TYPE linkedin_stage_errors_total counter",
+        ]
+        for (stage, labels), value in sorted(errors.items()):
+            lines.append(f"linkedin_stage_errors_total{_labels({'stage': stage, **dict(labels)})} {value}")
+
+        for name, kind, help_text, collect in self._collectors:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(labels)} {value}" for labels, value in collect()]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+stats = StageStats()
+
+
+# --- API usada pelo restante da aplicação ---
+@contextlib.contextmanager
+def start_trace(trace_id: str | None = None):
+    trace = Trace(trace_id)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+@contextlib.contextmanager
+def span(stage: str, **labels):
+    """
+    Mede a etapa `stage`. Os labels viram labels do histograma (use valores de baixa
+    cardinalidade); tokens e acertos de cache vão em `span.set(...)`.
+    """
+    current = Span(stage, labels)
+    parent = _span.get()
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        _span.reset(token)
+        current.duration = time.perf_counter() - current.start
+        _finish(current, parent)
+
+
+@contextlib.contextmanager
+def open_span(stage: str, **labels):
+    """
+    Como span(), mas o span continua aberto depois do bloco: o tempo é medido até a chamada
+    de `close()` devolvida junto com ele, que pode vir de outra task (ex.: no fim do corpo de
+    uma resposta em streaming). Os spans abertos no bloco, inclusive em tasks e threads
+    criadas nele, continuam filhos deste.
+    """
+    current = Span(stage, labels)
+    parent = _span.get()
+    trace = _trace.get()
+    closed = False
+
+    def close():
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        current.duration = time.perf_counter() - current.start
+        _finish(current, parent, trace)
+
+    token = _span.set(current)
+    try:
+        yield current, close
+    except BaseException:
+        current.error = True
+        close()
+        raise
+    finally:
+        _span.reset(token)
+
+
+def record(stage: str, duration: float, attributes: dict | None = None, **labels) -> Span:
+    """
+    Registra uma etapa já medida por outro componente (ex.: o run de um membro do Team,
+    cujo tempo vem das métricas do agno) como filha do span atual.
+    """
+    recorded = Span(stage, labels, start=time.perf_counter() - duration, duration=duration, attributes=attributes or {})
+    _finish(recorded, _span.get())
+    return recorded
+
+
+def _finish(finished: Span, parent: Span | None, trace: Trace | None = None):
+    if parent is not None:
+        parent.children += finished.duration
+    trace = trace or _trace.get()
+    if trace is not None:
+        trace.add(finished)
+    stats.observe(finished)
+
+
+def record_run_metrics(response, target: Span | None = None):
+    """
+    Copia os tokens de um run do agno para `target` e registra cada membro do Team
+    como um span "member_run" (tempo de modelo somado das métricas por mensagem).
+    """
+    if target is not None:
+        target.set(**_tokens(getattr(response, "metrics", None)))
+    for member in getattr(response, "member_responses", None) or []:
+        metrics = getattr(member, "metrics", None) or {}
+        name = getattr(member, "agent_name", None) or getattr(member, "team_name", None) or "member"
+        record("member_run", sum(metrics.get("time") or []), _tokens(metrics), member=name)
+
+
+def _tokens(metrics: dict | None) -> dict:
+    metrics = metrics or {}
+    return {
+        "input_tokens": sum(metrics.get("input_tokens") or []),
+        "output_tokens": sum(metrics.get("output_tokens") or []),
+    }